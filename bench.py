@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import numpy as np
+
+# Pricing micro-benchmarks, run offline against a recorded snapshot.
+#
+#   python data_sources.py export snapshot.sqlite          (once, with credentials)
+#   python data_sources.py export --raw sheets.json        (optional, to time parsing)
+#   python bench.py snapshot.sqlite --raw sheets.json --out bench.json
+#   python bench.py snapshot.sqlite --compare bench.json   (against an older run)
+#   python bench.py snapshot.sqlite --startup 5            (+ cold start: import and first request)
+#
+# Bonds are grouped by coupon case (fixed / 1st-year fixed / floating) and tenor
+# (short <= 5y, long > 5y). Every function and route is timed per group and reported
+# as p50/p95/p99 latency plus the peak memory allocated during one call. Routes are
+# timed with the response cache and the price grid off, then again with them on
+# ("[cached]"), so a pricing regression doesn't hide behind a cache hit.
+
+CCASE_NAMES = {0: "fixed", 1: "1st_yr_fixed", 2: "floating"}
+LONG_TENOR_DAYS = 5 * 365
+
+
+def _stats(samples):
+    ms = np.asarray(samples) * 1e3
+    return {"n": len(ms), "mean_ms": float(ms.mean()), "min_ms": float(ms.min()),
+            "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99))}
+
+
+def _alloc_kb(fn, runs=3):
+    """Peak traced memory of one call (KiB), best of a few runs."""
+    peaks = []
+    for _ in range(runs):
+        tracemalloc.start()
+        try:
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return min(peaks) / 1024
+
+
+def measure(name, group, fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    result = {"name": name, "group": group, **_stats(samples), "alloc_peak_kb": _alloc_kb(fn)}
+    print(f"{name:<22} {group:<22} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f}  "
+          f"p99 {result['p99_ms']:9.3f}  alloc {result['alloc_peak_kb']:9.1f} KiB", file=sys.stderr)
+    return result
+
+
+def bond_groups(df1, trd):
+    """{group name: [codes]} for the bonds that still have coupons after `trd`."""
+    from bond import return_ccase
+
+    groups = {}
+    for code in df1.index:
+        isd, mtd = df1.loc[code, "Issue Date"], df1.loc[code, "Maturity Date"]
+        if mtd <= trd:
+            continue
+        tenor = "long" if (mtd - isd).days > LONG_TENOR_DAYS else "short"
+        groups.setdefault(f"{CCASE_NAMES.get(return_ccase(code, df1), 'unknown')}/{tenor}", []).append(code)
+    return groups
+
+
+def _cycle(items):
+    # next item on every call, so a group's samples are spread over all of its bonds
+    state = {"i": -1}
+
+    def nxt():
+        state["i"] = (state["i"] + 1) % len(items)
+        return items[state["i"]]
+    return nxt
+
+
+def bench_functions(df1, df4, df5, trd, repeat, legacy=False):
+    from bond import Bond, book_for, return_ccase
+
+    book = book_for(df1, df4, df5)
+    results = []
+    for group, codes in sorted(bond_groups(df1, trd).items()):
+        codes = [c for c in codes if _prices(book.get(c), trd, df1.loc[c, "Price Yield"])]
+        if not codes:
+            continue
+        nxt = _cycle(codes)
+
+        def build():
+            Bond.from_df1(nxt(), df1, df4, df5)
+
+        def price():
+            c = nxt()
+            book.get(c).cashflow(trd, df1.loc[c, "Price Yield"])
+
+        def solve():
+            c = nxt()
+            bond = book.get(c)
+            ptd = bond.price(trd, df1.loc[c, "Price Yield"]).ptd
+            bond.solve_yield(trd, ptd)
+            bond.solve_yield(trd, ptd, after_tax=True, guess=0.035)
+
+        results.append(measure("bond_build", group, build, repeat))
+        results.append(measure("cashflow", group, price, repeat))
+        results.append(measure("solve_yield", group, solve, repeat))
+
+        if legacy:
+            from parity import legacy_cashflow, legacy_cashflow_for_reverse, legacy_reverso
+
+            def legacy_args(c):
+                r = df1.loc[c]
+                return (return_ccase(c, df1), r["Par value"], r["Issue Date"], r["Maturity Date"], trd,
+                        r["Ex right day"], r["Coupon% 1"], r["Coupon% Ref"], r["Coupon% k1"], r["k1 years"],
+                        r["Coupon% k2"], r["Coupon payment"])
+
+            def old_price():
+                c = nxt()
+                legacy_cashflow(df4, df5, c, *legacy_args(c), df1.loc[c, "Price Yield"])
+
+            def old_solve():
+                c = nxt()
+                ttt, ttt_i, frq, k = legacy_cashflow_for_reverse(c, df4, df5, *legacy_args(c))
+                ptd = book.get(c).price(trd, df1.loc[c, "Price Yield"]).ptd
+                legacy_reverso(ttt, ptd, frq, k, 0.07)
+                legacy_reverso(ttt_i.rename(columns={"Coupon_int": "Coupon", "CF_int": "CF"}), ptd, frq, k, 0.035)
+
+            results.append(measure("legacy_cashflow", group, old_price, repeat))
+            results.append(measure("legacy_reverso", group, old_solve, repeat))
+    return results
+
+
+def _prices(bond, trd, pry):
+    # the page routes also need a previous ex-right date, which a new bond doesn't have yet
+    try:
+        return bond.price(trd, pry).start > 0
+    except ValueError:
+        return False
+
+
+def bench_loading(snapshot, raw, repeat):
+    from data_sources import RawSheetsSource, SnapshotSource, parse_sheets
+
+    results = [measure("snapshot_load", "all", SnapshotSource(snapshot).load, repeat)]
+    if raw:
+        data = RawSheetsSource(raw).fetch_raw()
+        results.append(measure("parse_sheets", "all", lambda: parse_sheets(*data), repeat))
+    return results
+
+
+def bench_routes(df1, trd, repeat):
+    """Every route timed with the result caches off (the pricing), then on (suffix ' [cached]')."""
+    import main
+
+    main.ref_store.get()
+    # response cache + price grid: with them on, a repeated route is a cache lookup, not pricing
+    max_entries = main.response_cache.max_entries
+    results = []
+    for cached in (False, True):
+        main.response_cache.clear()
+        main.response_cache.max_entries = max_entries if cached else 0
+        main.price_grid.enabled = cached
+        results += _bench_routes(main, df1, trd, repeat, " [cached]" if cached else "")
+    return results
+
+
+def _bench_routes(main, df1, trd, repeat, suffix):
+    client = main.app.test_client()
+    results = []
+
+    def call(method, url, body=None):
+        resp = client.open(url, method=method, json=body)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{url} -> {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+
+    results.append(measure("GET /" + suffix, "first_bond", lambda: call("GET", "/"), repeat))
+    results.append(measure("POST /price_batch" + suffix, "all",
+                           lambda: call("POST", "/price_batch", {"trade_dates": [trd.isoformat()]}), repeat))
+
+    for group, codes in sorted(bond_groups(df1, trd).items()):
+        book = main.book_for(*main.ref_store.get())
+        codes = [c for c in codes if _prices(book.get(c), trd, df1.loc[c, "Price Yield"])]
+        if not codes:
+            continue
+        nxt = _cycle(codes)
+
+        def page_body(c):
+            r = df1.loc[c]
+            return {"resultCode": c, "parvalu": str(r["Par value"]), "isudate": r["Issue Date"].isoformat(),
+                    "matdate": r["Maturity Date"].isoformat(), "trddte": trd.isoformat(),
+                    "exrtday": str(r["Ex right day"]), "freqncy": r["Coupon payment"],
+                    "prcyld": str(r["Price Yield"] * 100), "reverso": str(r["Par value"])}
+
+        results.append(measure("POST /update_data" + suffix, group,
+                               lambda: call("POST", "/update_data", {"selected_option": nxt()}), repeat))
+        results.append(measure("POST /recalculate" + suffix, group,
+                               lambda: call("POST", "/recalculate", page_body(nxt())), repeat))
+        results.append(measure("POST /reverso" + suffix, group,
+                               lambda: call("POST", "/reverso", page_body(nxt())), repeat))
+    return results
+
+
+# run in a fresh interpreter: import main, optionally hit /_ah/warmup, then the first GET /
+STARTUP_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+if WARM:
+    client.get("/_ah/warmup")
+t2 = time.perf_counter()
+status = client.get("/").status_code
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "warmup": t2 - t1, "first_request": t3 - t2, "status": status}))
+"""
+
+
+def _import_times(env, top=12):
+    """Slowest imports of main (cumulative seconds) from python -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], capture_output=True, text=True,
+                         env=env, cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+    rows = []
+    for line in out.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative) / 1e6, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def bench_startup(runs):
+    """Cold start: import time of main and first GET / latency, without and with /_ah/warmup."""
+    env = dict(os.environ)
+    results = []
+    for warm in (False, True):
+        samples = {"import": [], "warmup": [], "first_request": []}
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", f"WARM = {warm}\n" + STARTUP_SCRIPT], capture_output=True,
+                                  text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr[-2000:])
+            run = json.loads(proc.stdout.strip().splitlines()[-1])
+            for key in samples:
+                samples[key].append(run[key])
+        group = "warm" if warm else "cold"
+        for key in (("import", "warmup", "first_request") if warm else ("import", "first_request")):
+            result = {"name": f"startup_{key}", "group": group, **_stats(samples[key]), "alloc_peak_kb": 0.0}
+            print(f"{result['name']:<22} {group:<22} p50 {result['p50_ms']:9.3f} ms  max {max(samples[key]) * 1e3:9.3f}",
+                  file=sys.stderr)
+            results.append(result)
+    print("slowest imports of main (cumulative):", file=sys.stderr)
+    for seconds, name in _import_times(env):
+        print(f"  {seconds * 1e3:8.1f} ms  {name}", file=sys.stderr)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["name"], r["group"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit')}):", file=sys.stderr)
+    for r in current["results"]:
+        o = old.get((r["name"], r["group"]))
+        if o:
+            print(f"{r['name']:<22} {r['group']:<22} p50 x{r['p50_ms'] / o['p50_ms']:6.2f}  "
+                  f"p99 x{r['p99_ms'] / o['p99_ms']:6.2f}  alloc x{r['alloc_peak_kb'] / max(o['alloc_peak_kb'], 1e-9):6.2f}",
+                  file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pricing micro-benchmarks")
+    parser.add_argument("snapshot", help=".sqlite file or .parquet directory (see data_sources.py export)")
+    parser.add_argument("--raw", help="raw sheet values JSON (export --raw), to time parse_sheets")
+    parser.add_argument("--trade-date", default=None, help="yyyy-mm-dd (default today)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--legacy", action="store_true", help="also time the original pandas implementation")
+    parser.add_argument("--no-routes", action="store_true")
+    parser.add_argument("--startup", type=int, default=0, metavar="RUNS",
+                        help="also time cold starts (import + first request) in RUNS fresh interpreters")
+    parser.add_argument("--out", help="write the results as JSON here (default: stdout)")
+    parser.add_argument("--compare", help="earlier JSON result to compare with")
+    args = parser.parse_args(argv)
+
+    # the routes have to read the same snapshot, main picks its source at import
+    os.environ["DATA_SOURCE"] = "snapshot"
+    os.environ["SNAPSHOT_PATH"] = args.snapshot
+
+    from data_sources import SnapshotSource
+    trd = datetime.strptime(args.trade_date, "%Y-%m-%d").date() if args.trade_date else date.today()
+    df1, df4, df5 = SnapshotSource(args.snapshot).load()
+
+    results = bench_loading(args.snapshot, args.raw, max(args.repeat // 10, 5))
+    results += bench_functions(df1, df4, df5, trd, args.repeat, legacy=args.legacy)
+    if not args.no_routes:
+        results += bench_routes(df1, trd, args.repeat)
+    if args.startup:
+        results += bench_startup(args.startup)
+
+    import pandas
+    out = {"meta": {"commit": _git_commit(), "trade_date": trd.isoformat(), "repeat": args.repeat,
+                    "bonds": len(df1), "python": platform.python_version(), "numpy": np.__version__,
+                    "pandas": pandas.__version__, "run_at": datetime.now().isoformat(timespec="seconds")},
+           "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(out, f, indent=1)
+    else:
+        json.dump(out, sys.stdout, indent=1)
+    if args.compare:
+        compare(out, args.compare)
+
+
+if __name__ == "__main__":
+    main()
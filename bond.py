@@ -0,0 +1,247 @@
+import threading
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+from calendars import calendars, settlement_dates
+from frame_cache import FrameCache
+from metrics import cache_hit, cache_miss, span
+from rates import announced_for, projector_for
+from schedule import build_schedule, frequency_months
+from solver import price_derivatives, yield_from_price
+
+# One bond, compiled once from its df1 row: schedule, projected coupons and
+# cash flows are kept as arrays, pricing for a trade date only slices them.
+# Replaces the copy-pasted cashflow() / cashflow_for_reverse() pair.
+# Nothing in here touches pandas per request; see parity.py for the check
+# against the original pandas implementation.
+
+AFTER_TAX = 0.55        # share of the coupon kept after tax (cashflow_for_reverse)
+
+Valuation = namedtuple("Valuation", ["ptd", "sumcf", "sumdc", "d_nxt", "total_cash_in", "prv_xdt",
+                                     "start", "dc"])
+# arrays over a yield grid: dirty price, modified duration (years), convexity, price change per 1bp
+Ladder = namedtuple("Ladder", ["yields", "ptd", "duration", "convexity", "dv01"])
+
+
+# return ccase >> ccase=0 FIXED coupon, ccase=1 1styrfixed coupon, ccase=2 all float coupon
+def return_ccase(code, df1):
+    if df1.loc[code, "Coupon Type"] == "Fixed" : return 0
+    else :
+        if df1.loc[code, "1st yr fixed"] == "y" : return 1
+        elif df1.loc[code, "1st yr fixed"] == "n" : return 2
+
+
+def coupon_rates(selected_option, ccase, sch, frq, df4, df5, cp1, cpR, cpk, cpkY, cpk2, projector=None):
+    """Annual coupon rate of every period in `sch` (float array, same length as the schedule)."""
+    # projected from the precomputed reference-group averages of df4 (see rates.py),
+    # or from another projector over the same years (rate scenarios, see scenarios.py)
+    projector = projector or projector_for(df4)
+    rates = projector.project(ccase, sch.pay_dates, frequency_months(frq), cp1, cpR, cpk, cpkY, cpk2)
+
+    # Announced rates override the projection on their coupon date
+    announced_for(df5).apply(selected_option, sch.pay_dates, rates)
+
+    return rates
+
+
+def format_number(x):
+    if isinstance(x, (int, float)):
+        return "{:,}".format(x)
+    return x
+
+
+class Bond:
+    """Schedule, coupons and cash flows of one bond, with fast pricing methods."""
+    __slots__ = ("code", "ccase", "par", "isd", "mtd", "exr", "frq",
+                 "calendar", "pay_dates", "days", "x_right", "rates", "coupon", "cf", "_l_payd", "_l_xrt")
+
+    def __init__(self, code, ccase, par, isd, mtd, exr, frq, cp1, cpR, cpk, cpkY, cpk2, df4, df5, projector=None,
+                 calendar=None):
+        self.code = code
+        self.ccase = ccase
+        self.par = par
+        self.isd = isd
+        self.mtd = mtd
+        self.exr = int(exr)
+        self.frq = frequency_months(frq)
+        self.calendar = calendar or None    # None: BOND_CALENDAR
+
+        with span("schedule", bond=code):
+            sch = build_schedule(isd, mtd, self.frq, self.exr, self.calendar)
+        self.pay_dates = sch.pay_dates
+        self.days = sch.days
+        self.x_right = sch.x_right
+        with span("coupon_projection", bond=code):
+            self.rates = coupon_rates(code, ccase, sch, self.frq, df4, df5, cp1, cpR, cpk, cpkY, cpk2, projector)
+        self.coupon = par * self.rates * self.days / 365
+        self.cf = self.coupon.copy()
+        if len(self.cf):
+            self.cf[-1] += par
+        for arr in (self.rates, self.coupon, self.cf):
+            arr.setflags(write=False)
+        # the same dates as datetime.date, for the tables and the JSON
+        self._l_payd = self.pay_dates.tolist()
+        self._l_xrt = self.x_right.tolist()
+
+    @classmethod
+    def from_df1(cls, code, df1, df4, df5, par=None, isd=None, mtd=None, exr=None, frq=None, projector=None):
+        """Build from the df1 row of `code`; keyword arguments override the sheet values."""
+        row = df1.loc[code]
+        # optional "Calendar" column: holiday calendar of the ex-right dates (see calendars.py)
+        calendar = row.get("Calendar")
+        return cls(code, return_ccase(code, df1),
+                   row["Par value"] if par is None else par,
+                   row["Issue Date"] if isd is None else isd,
+                   row["Maturity Date"] if mtd is None else mtd,
+                   row["Ex right day"] if exr is None else exr,
+                   row["Coupon payment"] if frq is None else frq,
+                   row["Coupon% 1"], row["Coupon% Ref"], row["Coupon% k1"], row["k1 years"], row["Coupon% k2"],
+                   df4, df5, projector, calendar if isinstance(calendar, str) else None)
+
+    def _start(self, trd):
+        """Index of the first coupon whose ex-right date is on/after the settlement date."""
+        d_set = settlement_dates(trd).item()     # datetime.date
+        start = int(np.searchsorted(self.x_right, np.datetime64(d_set, 'D'), side='left'))
+        if start >= len(self._l_payd):
+            raise ValueError(f"{self.code}: no coupon left after trade date {trd}")
+        return start, d_set
+
+    def _prev_payment(self, start):
+        return self.isd if start == 0 else self._l_payd[start - 1]
+
+    def accrual_factor(self, trd):
+        """k of the trading-price formula: share of the current period left after settlement."""
+        start, d_set = self._start(trd)
+        d_nxt = self._l_payd[start]
+        d_prv = self._prev_payment(start)
+        return (( d_nxt - d_set ).days * self.frq ) / (12 * (d_nxt - d_prv).days)
+
+    def cash_flows(self, trd, after_tax=False):
+        """Remaining cash flows after `trd` (coupons * 0.55 when after_tax), par included."""
+        start, _ = self._start(trd)
+        if not after_tax:
+            return self.cf[start:]
+        cf = self.coupon[start:] * AFTER_TAX
+        cf[-1] += self.par
+        return cf
+
+    def price(self, trd, pry):
+        """Dirty price `ptd` and the other figures cashflow() used to return."""
+        with span("discount", bond=self.code):
+            start, d_set = self._start(trd)
+            cf = self.cf[start:]
+            dc = cf / (1 + pry * self.frq / 12)**np.arange(len(cf))
+            sumdc = dc.sum()
+            d_nxt = self._l_payd[start]
+            d_prv = self._prev_payment(start)
+            ptd = sumdc / (1 + (( d_nxt - d_set ).days * pry * self.frq ) / (12 * (d_nxt - d_prv).days) )
+            total_cash_in = self.coupon[start:].sum() * 0.95 + self.par
+            prv_xdt = self._l_xrt[start - 1] if start > 0 else np.nan
+        return Valuation(ptd, cf.sum(), sumdc, d_nxt, total_cash_in, prv_xdt, start, dc)
+
+    def solve_yield(self, trd, prices, after_tax=False, guess=0.07):
+        """Yield(s) that give the trading price(s) `prices` (array in, array out)."""
+        with span("yield_solve", bond=self.code):
+            # cashflow_for_reverse rounded the flows to 3 decimals before solving
+            cf = np.round(self.cash_flows(trd, after_tax), 3)
+            return yield_from_price(cf, prices, self.frq, self.accrual_factor(trd), guess=guess)
+
+    def ladder(self, trd, yields):
+        """Dirty price and its sensitivities for every yield in `yields`, in one pass."""
+        with span("ladder", bond=self.code):
+            yields = np.asarray(yields, dtype=float)
+            cf, k = self.cash_flows(trd), self.accrual_factor(trd)
+            # a yield of -100% a period or below has no price: NaN/inf there, null in the JSON
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                p, dp, d2p = price_derivatives(yields, cf, self.frq, k)
+                return Ladder(yields, p, -dp / p, d2p / p, -dp * 1e-4)
+
+    def cashflow(self, trd, pry):
+        """(rows, ptd, sumcf, sumdc, d_nxt, total_cash_in, prv_xdt) like the old cashflow().
+
+        rows are plain tuples in CF_COLUMNS order, turn them into JSON with cashflow_records().
+        """
+        v = self.price(trd, pry)
+        s = v.start
+        rate = self.rates[s:]
+        if not np.isfinite(rate).all():
+            raise ValueError(f"{self.code}: no coupon rate for some payment dates (missing Interest years?)")
+        coupon = np.round(self.coupon[s:]).astype(np.int64)
+        cf = np.round(self.cf[s:]).astype(np.int64)
+        dc = np.round(v.dc).astype(np.int64)
+        rows = list(zip(self._l_payd[s:], self._l_xrt[s:], coupon.tolist(), cf.tolist(), dc.tolist(),
+                        np.round(rate * 100, 4).tolist()))
+        return rows, v.ptd, int(cf.sum()), v.sumdc, v.d_nxt, v.total_cash_in, v.prv_xdt
+
+
+CF_COLUMNS = ["Coupon Date [yyyy-mm-dd]", 'X right', "Coupon", "CF", "DC CF", "CP rate(%)"]
+
+
+def cashflow_records(rows):
+    """Format Bond.cashflow() rows for the page / JSON: dates as yyyy-mm-dd, numbers with thousands separators."""
+    return [{CF_COLUMNS[0]: d.strftime('%Y-%m-%d'),
+             CF_COLUMNS[1]: x.strftime('%Y-%m-%d'),
+             CF_COLUMNS[2]: format_number(cpn),
+             CF_COLUMNS[3]: format_number(cf),
+             CF_COLUMNS[4]: format_number(dc),
+             CF_COLUMNS[5]: format_number(rate)}
+            for d, x, cpn, cf, dc, rate in rows]
+
+
+def row_record(df1, code):
+    """df1 row of `code` as a plain dict (what d_send used to get from to_dict)."""
+    return {col: (val.item() if isinstance(val, np.generic) else val) for col, val in df1.loc[code].items()}
+
+
+class BondBook:
+    """Bonds built from one (df1, df4, df5), reused by every request on that data."""
+    max_bonds = 4096    # route inputs are part of the key, so don't let it grow forever
+
+    def __init__(self, df1, df4, df5):
+        # weak, so an old version of the sheets can go away after a refresh
+        self._refs = (weakref.ref(df1), weakref.ref(df4), weakref.ref(df5))
+        self._bonds = {}
+        self._lock = threading.Lock()
+        self.calendar_generation = calendars.generation
+
+    def get(self, code, par=None, isd=None, mtd=None, exr=None, frq=None):
+        """Bond `code`; the route inputs (par, dates, ex-right days, frequency) are part of the key."""
+        key = (code, par, isd, mtd, None if exr is None else int(exr), frq)
+        bond = self._bonds.get(key)
+        if bond is not None:
+            cache_hit("bond")
+        else:
+            cache_miss("bond")
+            df1, df4, df5 = (ref() for ref in self._refs)
+            bond = Bond.from_df1(code, df1, df4, df5, par=par, isd=isd, mtd=mtd, exr=exr, frq=frq)
+            with self._lock:
+                if len(self._bonds) >= self.max_bonds:
+                    self._bonds.clear()
+                bond = self._bonds.setdefault(key, bond)
+        return bond
+
+    def adopt(self, other, changes):
+        """Take over the bonds of `other` (the book of the previous data) that `changes` leaves valid."""
+        if other is self or changes.everything or other.calendar_generation != self.calendar_generation:
+            return 0
+        # key[1:] are the route overrides; with other dates any year of a changed rate column counts
+        kept = {key: bond for key, bond in list(other._bonds.items())
+                if not changes.affects(key[0], overridden=any(v is not None for v in key[1:]))}
+        with self._lock:
+            for key, bond in kept.items():
+                self._bonds.setdefault(key, bond)
+        return len(kept)
+
+    def __len__(self):
+        return len(self._bonds)
+
+
+_books = FrameCache()
+
+
+def book_for(df1, df4, df5):
+    """The BondBook of this (df1, df4, df5), kept as long as df1 is alive."""
+    # new holidays move ex-right dates, so the bonds built before them are stale too
+    return _books.get_or_build((df1, df4, df5), BondBook, stamp=calendars.generation)
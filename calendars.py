@@ -0,0 +1,125 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+# Business-day calendars for the ex-right dates (settlement stays trade date + 1 calendar day).
+# A calendar is Mon-Fri plus a holiday list, compiled once into a
+# numpy.busdaycalendar and cached until its holidays change. The "default"
+# calendar has no holidays (what pd.offsets.BusinessDay did), so no date moves
+# until holidays are configured:
+#   HOLIDAYS_PATH=holidays.csv   columns date[,calendar]  (or .json {calendar: [dates]})
+#   HOLIDAYS_SHEET=Holidays      same columns, read from the spreadsheet on every refresh
+# Rows without a calendar go to BOND_CALENDAR, the calendar the bonds use unless
+# df1 has a "Calendar" column.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALENDAR = os.environ.get("BOND_CALENDAR", "default")
+WEEKMASK = "1111100"
+
+
+class CalendarRegistry:
+    """Holiday lists by calendar name, and their compiled busdaycalendars."""
+
+    def __init__(self):
+        self._holidays = {}      # name -> sorted, unique datetime64[D] array
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self.generation = 0      # bumped whenever a holiday list changes
+
+    def set_holidays(self, holidays):
+        """Replace the holiday lists with {name: dates}. Returns True if anything changed."""
+        new = {name: np.unique(np.asarray(list(dates), dtype="datetime64[D]")) for name, dates in holidays.items()}
+        with self._lock:
+            if new.keys() == self._holidays.keys() and all(np.array_equal(new[k], self._holidays[k]) for k in new):
+                return False
+            self._holidays = new
+            self._compiled = {}
+            self.generation += 1
+        logger.info("holiday calendars loaded: %s", ", ".join(f"{k} ({len(v)})" for k, v in new.items()) or "none")
+        return True
+
+    def get(self, name=None):
+        """numpy.busdaycalendar of calendar `name` (default: BOND_CALENDAR)."""
+        name = name or DEFAULT_CALENDAR
+        cal = self._compiled.get(name)
+        if cal is None:
+            holidays = self._holidays.get(name)
+            if holidays is None and name not in (DEFAULT_CALENDAR, "default"):
+                raise ValueError(f"Unknown calendar {name!r}")
+            cal = np.busdaycalendar(weekmask=WEEKMASK, holidays=holidays if holidays is not None else [])
+            with self._lock:
+                cal = self._compiled.setdefault(name, cal)
+        return cal
+
+    def holidays(self):
+        """{name: dates} of every calendar, to hand to set_holidays() in another process."""
+        return dict(self._holidays)
+
+    def fingerprint(self):
+        """Content hash of all holiday lists (for cache keys that outlive the process)."""
+        h = hashlib.sha1()
+        for name in sorted(self._holidays):
+            h.update(name.encode())
+            h.update(self._holidays[name].astype(np.int64).tobytes())
+        return h.hexdigest()[:16]
+
+
+calendars = CalendarRegistry()
+
+
+def ex_right_dates(pay_dates, exr, calendar=None):
+    """pay_dates - exr business days of `calendar`, for a whole array at once."""
+    return np.busday_offset(pay_dates, -int(exr), roll="forward", busdaycal=calendars.get(calendar))
+
+
+def settlement_dates(trade_dates, lag=1):
+    """Settlement date of every trade date: + lag calendar days (the pricing convention, holidays or not)."""
+    return np.asarray(trade_dates, dtype="datetime64[D]") + lag
+
+
+def holidays_from_rows(rows):
+    """{calendar: [dates]} from sheet-like rows (header first, columns date[,calendar])."""
+    if not rows:
+        return {}
+    header = [str(h).strip().lower() for h in rows[0]]
+    i_date = header.index("date")
+    i_cal = header.index("calendar") if "calendar" in header else None
+    out = {}
+    for row in rows[1:]:
+        if i_date >= len(row) or not str(row[i_date]).strip():
+            continue
+        name = str(row[i_cal]).strip() if i_cal is not None and i_cal < len(row) and row[i_cal] else DEFAULT_CALENDAR
+        try:
+            out.setdefault(name, []).append(np.datetime64(str(row[i_date]).strip()[:10], "D"))
+        except ValueError:
+            logger.warning("holiday %r is not a yyyy-mm-dd date, skipped", row[i_date])
+    return out
+
+
+def load_holidays_file(path):
+    """{calendar: [dates]} from a CSV (date[,calendar]) or JSON ({calendar: [dates]}) file."""
+    with open(path, newline="") as f:
+        if path.endswith(".json"):
+            return {name: [np.datetime64(d, "D") for d in dates] for name, dates in json.load(f).items()}
+        return holidays_from_rows(list(csv.reader(f)))
+
+
+def load_configured_holidays(source=None):
+    """Load HOLIDAYS_PATH and/or HOLIDAYS_SHEET (through `source`) into the registry."""
+    holidays = {}
+    path = os.environ.get("HOLIDAYS_PATH")
+    if path:
+        holidays.update(load_holidays_file(path))
+    sheet = os.environ.get("HOLIDAYS_SHEET")
+    if sheet and hasattr(source, "fetch_values"):
+        for name, dates in holidays_from_rows(source.fetch_values(sheet)).items():
+            holidays.setdefault(name, []).extend(dates)
+    if path or sheet:
+        calendars.set_holidays(holidays)
+    return calendars
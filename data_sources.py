@@ -0,0 +1,395 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import SHEETS_CALLS, cache_hit, cache_miss, span
+from sheet_schema import parse_announced, parse_db, parse_interest
+
+# Where the reference data (DB / Interest / Announced_interest) comes from.
+# Every source returns the same parsed (df1, df4, df5) that the pricing code expects:
+#   SheetsSource   - the Google spreadsheet (default)
+#   MongoSource    - one collection per sheet
+#   SnapshotSource - a local SQLite file or Parquet directory written by `export`
+#   RawSheetsSource - the unparsed sheet values saved as JSON by `export --raw`
+#   FakeSheetsSource - generated sheets of FAKE_BONDS bonds, for local runs and tests
+# Pick one with DATA_SOURCE=sheets|mongo|snapshot|raw|fake
+# (+ SNAPSHOT_PATH for snapshots, RAW_SHEETS_PATH for raw).
+# With SHARED_DATA_DIR set, the source is shared by all the worker processes of
+# the machine: one of them loads it, the others map its published copy
+# (see shared_data.py).
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_ID = '1hEfWYWhbnfN3uURJTQNaDV3QAEEyMzKtmV888E0fA8M'
+CREDENTIALS_FILE = 'credentials.json'
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+SHEET_NAME1 = 'DB'
+SHEET_NAME4 = 'Interest'
+SHEET_NAME5 = 'Announced_interest'
+
+# snapshot table names, and the columns that have to come back as datetime.date
+SNAPSHOT_TABLES = {"df1": "db", "df4": "interest", "df5": "announced_interest"}
+DATE_COLUMNS = {"df1": ["Issue Date", "Maturity Date"], "df4": [], "df5": ["Coupon_Date"]}
+
+
+def parse_sheets(data1, data4, data5, errors=None):
+    """Turn the raw sheet values (lists of rows, header first) into df1, df4, df5 (see sheet_schema.py)."""
+    with span("parse_sheets"):
+        return parse_db(data1, errors), parse_interest(data4, errors), parse_announced(data5, errors)
+
+
+class SheetParser:
+    """parse_sheets() that hands back the previous frame of every sheet whose values didn't change.
+
+    Unchanged frames keep their identity, so the caches built on them (bond book, rate
+    projections) stay warm across a refresh.
+    """
+    parsers = (parse_db, parse_interest, parse_announced)
+
+    def __init__(self):
+        self._last = [None] * len(self.parsers)     # (digest of the raw values, parsed frame, row errors)
+        self._lock = threading.Lock()
+
+    @property
+    def errors(self):
+        """RowErrors of the rows left out by the last parse."""
+        return [e for last in self._last if last is not None for e in last[2]]
+
+    def parse(self, data1, data4, data5):
+        frames = []
+        with self._lock, span("parse_sheets"):
+            for i, (parse, values) in enumerate(zip(self.parsers, (data1, data4, data5))):
+                digest = hashlib.sha1(json.dumps(values).encode()).digest()
+                last = self._last[i]
+                if last is not None and last[0] == digest:
+                    cache_hit("sheet_parse")
+                    frames.append(last[1])
+                    continue
+                cache_miss("sheet_parse")
+                errors = []
+                frame = parse(values, errors)
+                self._last[i] = (digest, frame, errors)
+                frames.append(frame)
+        return tuple(frames)
+
+
+class DataSource:
+    """Base class: load() returns the parsed (df1, df4, df5)."""
+    name = "base"
+
+    def load(self):
+        raise NotImplementedError
+
+    def parse_errors(self):
+        """Rows the last load() skipped because they didn't parse (sheet_schema.RowError)."""
+        parser = getattr(self, "_parser", None)
+        return parser.errors if parser is not None else []
+
+
+class SheetsSource(DataSource):
+    """The live spreadsheet. One authorized client (and HTTP session) per source, reused by every
+    refresh; the three sheets come back in one batched values request, retried with backoff on
+    quota / server errors."""
+    name = "sheets"
+    max_retries = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+    backoff = float(os.environ.get("SHEETS_BACKOFF", "1.0"))      # seconds, doubled on every retry
+    retry_codes = (429, 500, 502, 503, 504)
+
+    def __init__(self, spreadsheet_id=SPREADSHEET_ID, credentials_file=CREDENTIALS_FILE):
+        self.spreadsheet_id = spreadsheet_id
+        self.credentials_file = credentials_file
+        self._spreadsheet = None
+        self._lock = threading.Lock()
+        self._parser = SheetParser()
+
+    def spreadsheet(self):
+        """The opened spreadsheet, authorized once and kept."""
+        if self._spreadsheet is None:
+            with self._lock:
+                if self._spreadsheet is None:
+                    import gspread
+                    from google.oauth2.service_account import Credentials
+
+                    # the credentials refresh their own token, the client keeps its session
+                    creds = Credentials.from_service_account_file(self.credentials_file, scopes=SCOPE)
+                    client = gspread.authorize(creds)
+                    SHEETS_CALLS.inc(call="open_by_key")
+                    self._spreadsheet = self._retry(client.open_by_key, self.spreadsheet_id)
+        return self._spreadsheet
+
+    def _retry(self, fn, *args):
+        from gspread.exceptions import APIError
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except APIError as e:
+                if e.code not in self.retry_codes or attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                logger.warning("Sheets API error %s, retrying in %.1fs", e.code, delay)
+                SHEETS_CALLS.inc(call="retry")
+                time.sleep(delay)
+
+    def fetch_raw(self):
+        """Return the raw values of the three sheets."""
+        from gspread.utils import fill_gaps
+
+        with span("fetch_sheets"):
+            names = (SHEET_NAME1, SHEET_NAME4, SHEET_NAME5)
+            SHEETS_CALLS.inc(call="values_batch_get")
+            res = self._retry(self.spreadsheet().values_batch_get, [f"'{name}'" for name in names])
+            # padded to a rectangle, like worksheet.get_all_values()
+            return tuple(fill_gaps(vr.get("values", [[]])) for vr in res["valueRanges"])
+
+    def fetch_values(self, name):
+        """Raw values of one more sheet (HOLIDAYS_SHEET, see calendars.py)."""
+        from gspread.utils import fill_gaps
+
+        SHEETS_CALLS.inc(call="values_get")
+        res = self._retry(self.spreadsheet().values_get, f"'{name}'")
+        return fill_gaps(res.get("values", [[]]))
+
+    def load(self):
+        return self._parser.parse(*self.fetch_raw())
+
+
+class MongoSource(DataSource):
+    """Same sheets stored as one MongoDB collection each (fields = sheet headers, values as text)."""
+    name = "mongo"
+
+    def __init__(self, uri=None, db_name=None):
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            pass
+        self.uri = uri or os.environ.get("MONGO_URI")
+        self.db_name = db_name or os.environ.get("MONGO_DB", "bonds")
+        self._parser = SheetParser()
+
+    def _collection_rows(self, db, name):
+        docs = list(db[name].find({}, {"_id": 0}))
+        if not docs:
+            raise ValueError(f"Mongo collection {name!r} is empty")
+        header = list(docs[0].keys())
+        return [header] + [[str(d.get(col, "")) for col in header] for d in docs]
+
+    def load(self):
+        from pymongo import MongoClient
+
+        client = MongoClient(self.uri)
+        try:
+            db = client[self.db_name]
+            return self._parser.parse(self._collection_rows(db, SHEET_NAME1),
+                                      self._collection_rows(db, SHEET_NAME4),
+                                      self._collection_rows(db, SHEET_NAME5))
+        finally:
+            client.close()
+
+
+class SnapshotSource(DataSource):
+    """Local snapshot: `*.sqlite`/`*.db` file, or a directory of Parquet files."""
+    name = "snapshot"
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if is_parquet_path(self.path):
+            frames = _read_parquet(self.path)
+        else:
+            frames = _read_sqlite(self.path)
+        return frames["df1"], frames["df4"], frames["df5"]
+
+
+class RawSheetsSource(DataSource):
+    """Raw sheet values saved as JSON (`export --raw`); parsed like the live sheets.
+
+    Useful offline: benchmarks of the parsing step, or a fake spreadsheet in local runs.
+    """
+    name = "raw"
+
+    def __init__(self, path):
+        self.path = path
+        self._parser = SheetParser()
+
+    def fetch_raw(self):
+        with open(self.path) as f:
+            raw = json.load(f)
+        return raw[SHEET_NAME1], raw[SHEET_NAME4], raw[SHEET_NAME5]
+
+    def load(self):
+        return self._parser.parse(*self.fetch_raw())
+
+
+class FakeSheetsSource(DataSource):
+    """Generated sheets in the live layout: `n_bonds` fixed and floating bonds, an Interest
+    sheet over `reference_banks` and a few announced rates. Same seed, same sheets; edit
+    `sheets` to simulate a change of the spreadsheet."""
+    name = "fake"
+    reference_banks = ("BIDV", "VCB", "AGR", "CTG")
+
+    def __init__(self, n_bonds=200, seed=0, first_year=2020, years=20):
+        rng = random.Random(seed)
+        self._parser = SheetParser()
+        self.loads = 0
+        db = [["Code", "Issue Date", "Maturity Date", "Price Yield", "Coupon% 1", "Coupon% k1", "Coupon% k2",
+               "Bond size", "Par value", "Ex right day", "k1 years", "Coupon Type", "1st yr fixed",
+               "Coupon% Ref", "Coupon payment"]]
+        announced = [["Bond_Code", "Coupon_Date", "Announced_rate"]]
+        for i in range(n_bonds):
+            isd_year = first_year + rng.randrange(years // 2)
+            isd = f"{isd_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            mtd = f"{isd_year + rng.randint(2, years // 2)}{isd[4:]}"
+            floating = rng.random() < 0.6
+            refs = ", ".join(rng.sample(self.reference_banks, rng.randint(1, 3)))
+            first_fixed = rng.choice("yn")
+            code = f"{'FL' if floating else 'FX'}{i:05d}"
+            db.append([code, isd, mtd, f"{rng.uniform(6, 11):.2f}%", f"{rng.uniform(6, 11):.2f}%",
+                       f"{rng.uniform(2, 4):.2f}%" if floating else "", f"{rng.uniform(2, 4):.2f}%" if floating else "",
+                       f"{rng.randrange(1, 100) * 10_000_000:,}", "100,000", str(rng.randint(3, 10)),
+                       str(rng.randint(1, 3)) if floating else "", "Floating" if floating else "Fixed",
+                       first_fixed if floating else "", refs if floating else "",
+                       rng.choice(("quarterly", "semi-annually", "annually"))])
+            if floating and rng.random() < 0.2:
+                announced.append([code, f"{isd_year + 1}{isd[4:]}", f"{rng.uniform(7, 10):.2f}%"])
+        interest = [["year", *self.reference_banks]]
+        for y in range(first_year, first_year + years + 1):
+            interest.append([f"Y{y}", *(f"{rng.uniform(4, 7):.2f}%" for _ in self.reference_banks)])
+        self.sheets = {SHEET_NAME1: db, SHEET_NAME4: interest, SHEET_NAME5: announced}
+
+    def fetch_raw(self):
+        self.loads += 1
+        return tuple([list(row) for row in self.sheets[name]] for name in (SHEET_NAME1, SHEET_NAME4, SHEET_NAME5))
+
+    def load(self):
+        return self._parser.parse(*self.fetch_raw())
+
+
+def write_raw(path, data1, data4, data5):
+    """Save raw sheet values (lists of rows) as JSON for RawSheetsSource."""
+    with open(path + ".tmp", "w") as f:
+        json.dump({SHEET_NAME1: data1, SHEET_NAME4: data4, SHEET_NAME5: data5}, f)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def is_parquet_path(path):
+    return path.endswith(".parquet") or os.path.isdir(path)
+
+
+def _to_dates(df, columns):
+    import pandas as pd
+
+    for col in columns:
+        df[col] = pd.to_datetime(df[col]).dt.date
+    return df
+
+
+def _read_sqlite(path):
+    import pandas as pd
+
+    frames = {}
+    con = sqlite3.connect(path)
+    try:
+        for key, table in SNAPSHOT_TABLES.items():
+            frames[key] = _to_dates(pd.read_sql(f'SELECT * FROM "{table}"', con), DATE_COLUMNS[key])
+    finally:
+        con.close()
+    frames["df1"] = frames["df1"].set_index("Code")
+    return frames
+
+
+def _read_parquet(path):
+    # pyarrow hands date32 columns back as datetime.date, so nothing to convert here
+    import pandas as pd
+
+    frames = {}
+    for key, table in SNAPSHOT_TABLES.items():
+        frames[key] = pd.read_parquet(os.path.join(path, table + ".parquet"))
+    return frames
+
+
+def write_snapshot(path, df1, df4, df5):
+    """Write parsed (df1, df4, df5) to a SQLite file or a Parquet directory."""
+    frames = {"df1": df1.reset_index(), "df4": df4, "df5": df5}
+    if is_parquet_path(path):
+        os.makedirs(path, exist_ok=True)
+        frames["df1"] = df1   # parquet keeps the Code index
+        for key, table in SNAPSHOT_TABLES.items():
+            frames[key].to_parquet(os.path.join(path, table + ".parquet"))
+        return path
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = sqlite3.connect(tmp_path)
+    try:
+        for key, table in SNAPSHOT_TABLES.items():
+            df = frames[key].copy()
+            for col in DATE_COLUMNS[key]:
+                df[col] = df[col].map(lambda x: x.isoformat() if x is not None and x == x else None)
+            df.to_sql(table, con, index=False)
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, path)   # readers never see a half written snapshot
+    return path
+
+
+def get_source(name=None, shared_dir=None):
+    """Build the source named by `name` or the DATA_SOURCE env var (default: sheets),
+    shared through `shared_dir` or SHARED_DATA_DIR if set."""
+    name = name or os.environ.get("DATA_SOURCE", "sheets")
+    shared_dir = shared_dir or os.environ.get("SHARED_DATA_DIR")
+    if name == "sheets":
+        source = SheetsSource()
+    elif name == "mongo":
+        source = MongoSource()
+    elif name == "snapshot":
+        source = SnapshotSource(os.environ.get("SNAPSHOT_PATH", "snapshot.sqlite"))
+    elif name == "raw":
+        source = RawSheetsSource(os.environ.get("RAW_SHEETS_PATH", "sheets.json"))
+    elif name == "fake":
+        source = FakeSheetsSource(int(os.environ.get("FAKE_BONDS", "200")), int(os.environ.get("FAKE_SEED", "0")))
+    else:
+        raise ValueError(f"Unknown DATA_SOURCE {name!r}")
+    if shared_dir:
+        from shared_data import SharedSource
+
+        return SharedSource(source, shared_dir)
+    return source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference data sources")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="save the current sheets as a local snapshot")
+    exp.add_argument("path", help="output .sqlite file or .parquet directory (.json with --raw)")
+    exp.add_argument("--source", default="sheets", choices=["sheets", "mongo", "snapshot", "raw", "fake"])
+    exp.add_argument("--raw", action="store_true", help="save the unparsed sheet values as JSON instead")
+    args = parser.parse_args(argv)
+
+    if args.command == "export" and args.raw:
+        source = get_source(args.source)
+        if not hasattr(source, "fetch_raw"):
+            parser.error(f"--raw needs a source with raw sheet values, not {args.source!r}")
+        data1, data4, data5 = source.fetch_raw()
+        write_raw(args.path, data1, data4, data5)
+        print(f"wrote raw values of {len(data1) - 1} bonds to {args.path}")
+    elif args.command == "export":
+        df1, df4, df5 = get_source(args.source).load()
+        write_snapshot(args.path, df1, df4, df5)
+        print(f"wrote {len(df1)} bonds, {len(df4)} interest rows, {len(df5)} announced rates to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
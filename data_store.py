@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+
+from metrics import cache_hit, cache_miss, span
+
+# Process-wide in-memory store for the parsed reference sheets (df1 / df4 / df5).
+# Requests read whatever is in memory; a stale copy is still served while a
+# background thread reloads it (stale-while-revalidate).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get("REFDATA_TTL", 300))                     # seconds before data counts as stale
+DEFAULT_REFRESH_INTERVAL = float(os.environ.get("REFDATA_REFRESH_INTERVAL", 0))  # 0 = no periodic refresher
+
+
+class RefData:
+    """One loaded version of the reference sheets."""
+    __slots__ = ("df1", "df4", "df5", "version", "loaded_at")
+
+    def __init__(self, df1, df4, df5, version, loaded_at):
+        self.df1 = df1
+        self.df4 = df4
+        self.df5 = df5
+        self.version = version
+        self.loaded_at = loaded_at
+
+    # so that `df1, df4, df5 = store.get()` keeps working in the routes
+    def __iter__(self):
+        return iter((self.df1, self.df4, self.df5))
+
+
+class ReferenceDataStore:
+    """Keeps the latest RefData in memory and refreshes it in the background."""
+
+    def __init__(self, loader, ttl=DEFAULT_TTL, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._data = None
+        self._version = 0
+        self._lock = threading.Lock()          # guards _data / _version swaps
+        self._load_lock = threading.Lock()     # only one loader call at a time
+        self._refreshing = False
+        self._thread = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Call `callback(data)` with every newly loaded RefData (for precomputed state)."""
+        self._listeners.append(callback)
+        return callback
+
+    def get(self):
+        """Return the current RefData, loading it on first use."""
+        self.start()
+        data = self._data
+        if data is None:
+            cache_miss("reference_data")
+            return self.refresh()
+        if self.is_stale():
+            cache_miss("reference_data_stale")
+            self.refresh_async()
+        else:
+            cache_hit("reference_data")
+        return data
+
+    def is_stale(self):
+        data = self._data
+        return data is None or (time.monotonic() - data.loaded_at) >= self.ttl
+
+    def age(self):
+        """Seconds since the data in memory was loaded (None before the first load)."""
+        data = self._data
+        return None if data is None else time.monotonic() - data.loaded_at
+
+    def refresh(self):
+        """Load the sheets now and swap them in. Returns the new RefData."""
+        with self._load_lock:
+            # somebody else may have finished a load while we were waiting
+            data = self._data
+            if data is not None and not self.is_stale():
+                return data
+            with span("load_data"):
+                df1, df4, df5 = self.loader()
+            data = RefData(df1, df4, df5, self._version + 1, time.monotonic())
+            # derived state is built before the swap, so readers never see a half prepared version
+            for callback in self._listeners:
+                callback(data)
+            with self._lock:
+                self._version = data.version
+                self._data = data
+            logger.info("reference data loaded (version %s)", data.version)
+            return data
+
+    def refresh_async(self):
+        """Start a background reload unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            # keep serving the old copy, we'll try again next time
+            logger.exception("background reference data refresh failed")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def invalidate(self, wait=False):
+        """Mark the current data as stale and reload it."""
+        with self._lock:
+            if self._data is not None:
+                self._data.loaded_at = float("-inf")
+        if wait or self._data is None:
+            return self.refresh()
+        self.refresh_async()
+        return self._data
+
+    def start(self):
+        """Start the periodic refresher thread (once) if an interval is configured."""
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_refresher, daemon=True)
+            self._thread.start()
+
+    def _run_refresher(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.invalidate(wait=True)
+            except Exception:
+                logger.exception("periodic reference data refresh failed")
+
+    @property
+    def version(self):
+        return self._version
@@ -0,0 +1,127 @@
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+# Which bonds a refresh actually changes.
+# A bond's valuation depends on its own df1 row, on its df5 (announced) rows and,
+# for the floating bonds, on the df4 cells of its reference columns in the years
+# its coupons are paid. diff_refdata() compares two versions of the sheets cell
+# by cell and turns the differences into the set of affected codes, so the bond
+# book, the response cache and the price grid can keep everything else
+# (see register_data_digest in main.py).
+#
+# The year span of a bond is taken as issue year .. maturity year + 1, a superset
+# of its payment years, so the index never needs the schedules themselves.
+
+logger = logging.getLogger(__name__)
+
+
+class Changes(namedtuple("Changes", ["codes", "rate_codes", "everything"])):
+    """codes: bonds whose sheet valuation changed; rate_codes: floating bonds on a changed
+    reference column in any year (their valuations with other dates may have moved);
+    everything: the layout of a sheet changed, nothing can be reused."""
+    __slots__ = ()
+
+    def affects(self, code, overridden=False):
+        """True if results of `code` computed on the old data are stale (`overridden`: with route dates)."""
+        return self.everything or code in self.codes or (overridden and code in self.rate_codes)
+
+
+NOTHING = Changes(frozenset(), frozenset(), False)
+EVERYTHING = Changes(frozenset(), frozenset(), True)
+
+
+class DependencyIndex:
+    """Reference columns and coupon years of every floating bond of one df1."""
+
+    def __init__(self, df1):
+        floating = (df1["Coupon Type"] != "Fixed").to_numpy()
+        self.codes = df1.index[floating]
+        self.groups = df1.loc[floating, "Coupon% Ref"].astype(str).to_numpy()
+        self.first_year = np.array([d.year for d in df1.loc[floating, "Issue Date"]], dtype=np.int64)
+        self.last_year = np.array([d.year for d in df1.loc[floating, "Maturity Date"]], dtype=np.int64) + 1
+
+    def affected(self, cells):
+        """(codes paying in a changed (year, column) cell, codes on a changed column at all)."""
+        by_column = {}
+        for year, column in cells:
+            by_column.setdefault(column, []).append(year)
+        in_years = np.zeros(len(self.codes), dtype=bool)
+        on_column = np.zeros(len(self.codes), dtype=bool)
+        for group in set(self.groups):
+            members = self.groups == group
+            for column in group.split(', '):
+                years = by_column.get(column)
+                if not years:
+                    continue
+                years = np.asarray(years, dtype=np.int64)
+                on_column |= members
+                in_years |= members & ((self.first_year[:, None] <= years) & (years <= self.last_year[:, None])).any(axis=1)
+        return set(self.codes[in_years]), set(self.codes[on_column])
+
+
+def _row_hashes(df):
+    import pandas as pd
+
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy(), index=df.index)
+
+
+def changed_codes(old_df1, new_df1):
+    """Codes whose df1 row was added, removed or edited."""
+    old, new = _row_hashes(old_df1), _row_hashes(new_df1)
+    both = old.index.intersection(new.index)
+    edited = both[old.loc[both].to_numpy() != new.loc[both].to_numpy()]
+    return set(edited) | set(old.index.symmetric_difference(new.index))
+
+
+def changed_rate_cells(old_df4, new_df4):
+    """(year, column) of every Interest cell that differs, including added/removed years and columns."""
+    old = old_df4.set_index("year")
+    new = new_df4.set_index("year")
+    years = old.index.union(new.index)
+    columns = old.columns.union(new.columns)
+    a = old.reindex(index=years, columns=columns).to_numpy(dtype=float)
+    b = new.reindex(index=years, columns=columns).to_numpy(dtype=float)
+    # a year or column present on one side only shows up as NaN against a value
+    missing = ~(years.isin(old.index) & years.isin(new.index))[:, None] | ~(columns.isin(old.columns) & columns.isin(new.columns))[None, :]
+    diff = ~((a == b) | (np.isnan(a) & np.isnan(b))) | missing
+    rows, cols = np.nonzero(diff)
+    return [(int(years[r]), columns[c]) for r, c in zip(rows, cols)]
+
+
+def changed_announcements(old_df5, new_df5):
+    """Codes whose announced-rate rows differ (order counts: the last duplicate wins)."""
+    cols = ["Bond_Code", "Coupon_Date", "Announced_rate"]
+    old, new = old_df5[cols], new_df5[cols]
+    old_rows = _row_hashes(old).to_numpy()
+    new_rows = _row_hashes(new).to_numpy()
+    per_code = lambda codes, rows: {c: tuple(rows[codes == c]) for c in set(codes)}
+    a = per_code(old["Bond_Code"].to_numpy(), old_rows)
+    b = per_code(new["Bond_Code"].to_numpy(), new_rows)
+    return {c for c in set(a) | set(b) if a.get(c) != b.get(c)}
+
+
+def diff_refdata(old, new):
+    """Changes from RefData (or (df1, df4, df5)) `old` to `new`."""
+    old_df1, old_df4, old_df5 = old
+    new_df1, new_df4, new_df5 = new
+    if old_df1 is new_df1 and old_df4 is new_df4 and old_df5 is new_df5:
+        return NOTHING
+    if (list(old_df1.columns) != list(new_df1.columns) or list(old_df5.columns) != list(new_df5.columns)
+            or not all("year" in df.columns and df["year"].is_unique for df in (old_df4, new_df4))):
+        return EVERYTHING
+
+    codes = set() if old_df1 is new_df1 else changed_codes(old_df1, new_df1)
+    rate_codes = set()
+    if old_df4 is not new_df4:
+        cells = changed_rate_cells(old_df4, new_df4)
+        if cells:
+            in_years, rate_codes = DependencyIndex(new_df1).affected(cells)
+            codes |= in_years
+    if old_df5 is not new_df5:
+        codes |= changed_announcements(old_df5, new_df5)
+    # a removed code stays in: what was cached or built for it must not carry over
+    logger.info("refresh changes %d of %d bonds (%d more with other dates)",
+                len(codes), len(new_df1), len(rate_codes - codes))
+    return Changes(frozenset(codes), frozenset(rate_codes), False)
@@ -0,0 +1,45 @@
+import weakref
+
+# Things built from the sheet DataFrames (bond books, rate projectors, bond
+# arrays...), kept for as long as the DataFrames they were built from.
+# Entries are keyed by id() of the first frame and checked against weak
+# references to all of them, since an id can be reused once its frame is gone.
+# The entry goes away with the first frame (weakref.finalize), so an old version
+# of the sheets isn't kept alive by its caches after a refresh.
+# `stamp` is anything else the value depends on (the holiday calendar generation):
+# an entry with another stamp is rebuilt.
+
+
+class FrameCache:
+    """Values keyed by a tuple of DataFrames (by identity) and a stamp."""
+
+    def __init__(self):
+        self._entries = {}      # id(frames[0]) -> (stamp, weakrefs of the frames, value)
+
+    def get(self, frames, stamp=None):
+        """The value stored for exactly these frames and stamp, or None."""
+        entry = self._entries.get(id(frames[0]))
+        if entry is not None and entry[0] == stamp and len(entry[1]) == len(frames) and \
+                all(ref() is df for ref, df in zip(entry[1], frames)):
+            return entry[2]
+        return None
+
+    def put(self, frames, value, stamp=None):
+        """Store `value` for these frames and stamp (replacing what the first frame had)."""
+        key = id(frames[0])
+        if key not in self._entries:
+            # one finalizer per frame: a replaced entry keeps the one of its first insert
+            weakref.finalize(frames[0], self._entries.pop, key, None)
+        self._entries[key] = (stamp, tuple(weakref.ref(df) for df in frames), value)
+        return value
+
+    def get_or_build(self, frames, build, stamp=None):
+        """The stored value, or build(*frames) stored and returned."""
+        value = self.get(frames, stamp)
+        return value if value is not None else self.put(frames, build(*frames), stamp)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,378 +1,38 @@
-from flask import Flask, render_template, request, jsonify
-from google.cloud import datastore
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from datetime import datetime, timezone, date
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
-from dateutil.relativedelta import relativedelta
 import numpy as np
-from scipy.optimize import newton
-# from pymongo import MongoClient
-# import os
-# from dotenv import load_dotenv
-
-# Define a function to strip '%' and convert to float
-def strip_percent_and_divide(x):
-    try:
-        return float(x.strip('%')) / 100
-    except AttributeError:
-        return x
-    except ValueError:
-        return x
-    
-# Function to calculate trading price based on pry
-def calculate_trading_price(pry, df, frq, k):
-    df['i'] = range(len(df))
-    df["DC CF"] = df["CF"] / (1 + pry * frq / 12)**df["i"]
-    return df["DC CF"].sum() / (1 + k * pry)
-
-# Target function for root finding
-def target_function(pry, df, trading_price, frq, k):
-    return calculate_trading_price(pry, df, frq, k) - trading_price
-
-def format_number(x):
-    if isinstance(x, (int, float)):
-        return "{:,}".format(x)
-    return x
-
-# return ccase >> ccase=0 FIXED coupon, ccase=1 1styrfixed coupon, ccase=2 all float coupon
-def return_ccase(code, df1):
-    if df1.loc[code, "Coupon Type"] == "Fixed" : return 0
-    else : 
-        if df1.loc[code, "1st yr fixed"] == "y" : return 1
-        elif df1.loc[code, "1st yr fixed"] == "n" : return 2
+import os
+import shutil
+import tempfile
+from data_store import ReferenceDataStore
+from data_sources import get_source
+from pricing import BUILD_ERRORS, fee_rates, price_batch, price_series
+from rates import announced_for, projector_for
+from bond import return_ccase, book_for, cashflow_records, row_record, CF_COLUMNS
+import metrics
+from metrics import span
+from schedule import schedule_cache_info
+from calendars import calendars, load_configured_holidays
+from response_cache import ResponseCache, data_digest
+from dependencies import diff_refdata
+from price_grid import PriceGrid
+from portfolio import guess_format, ndjson, read_positions, text_lines, value_positions
+from scenarios import MAX_SCENARIOS, reprice_scenarios, shock_from_json
+
+data_source = get_source()
 
 def bring_the_dfs():
-    # Let's try to bring in the data from the Spreadsheet
-    CREDENTIALS_FILE = 'credentials.json'
-
-    # Define the scope and authenticate
-    SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPE)
-    client = gspread.authorize(creds)
-
-    # Google Spreadsheet ID and sheet name
-    SPREADSHEET_ID = '1hEfWYWhbnfN3uURJTQNaDV3QAEEyMzKtmV888E0fA8M'
-    SHEET_NAME1 = 'DB'
-    SHEET_NAME4 = 'Interest'
-    SHEET_NAME5 = 'Announced_interest'
-
-    # Open the spreadsheet by ID and sheet by name
-    spreadsheet = client.open_by_key(SPREADSHEET_ID)
-    worksheet1 = spreadsheet.worksheet(SHEET_NAME1)
-    worksheet4 = spreadsheet.worksheet(SHEET_NAME4)
-    worksheet5 = spreadsheet.worksheet(SHEET_NAME5)
-
-    data1 = worksheet1.get_all_values()
-    df1 = pd.DataFrame(data1[1:], columns=data1[0])
-    data4 = worksheet4.get_all_values()
-    df4 = pd.DataFrame(data4[1:], columns=data4[0])
-    data5 = worksheet5.get_all_values()
-    df5 = pd.DataFrame(data5[1:], columns=data5[0])
-
-    df1.set_index("Code", inplace=True, drop=True)
-
-    df1["Issue Date"] = pd.to_datetime(df1["Issue Date"]).dt.date
-    df1["Maturity Date"] = pd.to_datetime(df1["Maturity Date"]).dt.date
-    df1['Price Yield'] = df1['Price Yield'].replace('', '0')
-    df1['Coupon% 1']  = df1['Coupon% 1'].replace('', '0')
-    df1['Coupon% k1'] = df1['Coupon% k1'].replace('', '0')
-    df1['Coupon% k2'] = df1['Coupon% k2'].replace('', '0')
-
-    df1['Price Yield'] = df1['Price Yield'].str.strip('%').astype(float) / 100
-    df1['Coupon% 1'] = df1['Coupon% 1'].str.strip('%').astype(float) / 100
-    df1['Coupon% k1'] = df1['Coupon% k1'].str.strip('%').astype(float) / 100
-    df1['Coupon% k2'] = df1['Coupon% k2'].str.strip('%').astype(float) / 100
-    # Replace empty strings with 0
-    df1['Bond size'] = df1['Bond size'].replace('', '0')
-    df1['Bond size'] = df1['Bond size'].str.replace(',', '').astype(float)
-
-    df1['Par value'] = df1['Par value'].replace('', '0')
-    df1['Par value'] = df1['Par value'].str.replace(',', '').astype(int)
-
-    df1['Ex right day'] = df1['Ex right day'].replace('', '0')
-    df1['Ex right day'] = df1['Ex right day'].str.replace(',', '').astype(int)
-
-    df1['k1 years'] = df1['k1 years'].replace('', '0')
-    df1['k1 years'] = df1['k1 years'].str.replace(',', '').astype(float)
-
-    df4.replace('', np.nan, inplace=True)
-    df4 = df4.ffill(axis=0) # inccase the future interest predictions are not filled, it takes the "Today" values as the interest rate
-    df4 = df4.set_index("year").map(strip_percent_and_divide).reset_index()
-    df4['year'] = df4['year'].str[1:].astype(int)
-
-    df5["Coupon_Date"] = pd.to_datetime(df5["Coupon_Date"]).dt.date
-    df5["Announced_rate"] = df5["Announced_rate"].map(strip_percent_and_divide)
-
-    return df1, df4, df5
-
-def cashflow(df4, df5, selected_option, ccase, par, isd, mtd, trd, exr, cp1, cpR, cpk, cpkY, cpk2, frq, pry):
-    if frq == "quarterly" :
-        frq = 3
-    elif frq == "annually" :
-        frq = 12
-    elif frq == "semi-annually" :
-        frq = 6
-    else :
-        raise Warning("Frequency => incorrect value")
-
-    d_set = trd + relativedelta(days=1)
-
-    # Generate the list of dates
-    l_payd = []
-    paydX = isd + relativedelta(months=frq)  # Start from the first increment
-    i = 1
-    while paydX < mtd:
-        # l_payd.append(paydX)
-        l_payd.append(isd + relativedelta(months=frq*i))
-        paydX = l_payd[-1]
-        i += 1
-
-    l_days = []
-    paydX = isd
-    for x in l_payd :
-        l_days.append((x-paydX).days)
-        paydX = x
-
-    data = {"d"      : l_days,
-            "Date"   : l_payd}
-    df = pd.DataFrame(data)
-    # calculate the coupons
-    # if FIXED
-    if ccase == 0 :
-        df["CP rate(%)"] = cp1
-
-    # if 1st year fixed, and the rest are ref
-    elif ccase == 1 :
-        r_grp = cpR.split(', ')
-        # Extract the year from the Date column in df
-        df['year'] = df['Date'].apply(lambda x: x.year)
-
-        # Calculate the average for each year in df4
-        df4['average'] = df4[r_grp].mean(axis=1)
-
-        # Merge df with df4 on the year
-        df = df.merge(df4[['year', 'average']], on='year', how='left')
-        
-        # Rename the average column to cppp
-        df.rename(columns={'average': 'CP rate(%)'}, inplace=True)
-
-        df.loc[:int(12/frq)-1, 'CP rate(%)'] = cp1 # 1st year fixed coupon!!!!
-        df.loc[int(12/frq):, 'CP rate(%)'] = df.loc[int(12/frq):, 'CP rate(%)'] + cpk
-
-    elif ccase == 2 :
-        r_grp = cpR.split(', ')
-        # Extract the year from the Date column in df
-        df['year'] = df['Date'].apply(lambda x: x.year)
-
-        # Calculate the average for each year in df4
-        df4['average'] = df4[r_grp].mean(axis=1)
-
-        # Merge df with df4 on the year
-        df = df.merge(df4[['year', 'average']], on='year', how='left')
-        
-        # Rename the average column to cppp
-        df.rename(columns={'average': 'CP rate(%)'}, inplace=True)
-
-        # df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] = cpk # 1st year fixed coupon!!!!
-        df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] = df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] + cpk
-        df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] = df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] + cpk2
-
-
-    # change df1.index[ind_a] to selected_option
-    # Check if b_code exists in df5['Bond_Code']
-    if selected_option in df5['Bond_Code'].values:
-        # Iterate over all rows in df5 with the given b_code
-        for _, row in df5[df5['Bond_Code'] == selected_option].iterrows():
-            coupon_date = row['Coupon_Date']
-            announced_rate = row['Announced_rate']
-            
-            # Update df['cppp'] where df['Date'] matches df5['Coupon_Date']
-            df.loc[df['Date'] == coupon_date, 'CP rate(%)'] = announced_rate
-
-    df["Coupon"] = par * df["CP rate(%)"] * df["d"] / 365
-
-    df["Coupon Date [yyyy-mm-dd]"] = pd.to_datetime(df["Date"])
-    df['X right'] = df['Coupon Date [yyyy-mm-dd]'] - pd.offsets.BusinessDay(n=exr)
-
-    df["Coupon Date [yyyy-mm-dd]"] = df["Coupon Date [yyyy-mm-dd]"].dt.date
-    df['X right'] = df['X right'].dt.date
-
-    prv_xdt = df[df['X right'] < d_set]['X right'].max()
-
-    msk = df["X right"] >= d_set
-    df = df[msk].copy()
-    df['i'] = range(len(df))
-
-    # print(df)
-
-    df["CF"] = df["Coupon"]
-    df.loc[df.index[-1], 'CF'] = df.loc[df.index[-1], 'CF'] + par
-    df["DC CF"] = df["CF"] / (1 + pry * frq / 12)**df["i"]
-
-    total_cash_in = df["Coupon"].sum() * 0.95 + par
-
-    sumdc = df["DC CF"].sum()
-    d_nxt = df.iloc[0]['Date']
-    
-    if l_payd.index(d_nxt) == 0 :
-        d_prv = isd
-    else :
-        d_prv = l_payd[l_payd.index(d_nxt) -1]
-
-    ptd = sumdc / (1 + (( d_nxt - d_set ).days * pry * frq ) / (12 * (d_nxt - d_prv).days) )
-
-    # print("l_days[0] ",l_days[0])
-    # print("d_nxt - d_prv", (d_nxt - d_prv).days)
-    # print("d_nxt", d_nxt)
-    # print("d_prv", d_prv)
-
-    df["CP rate(%)"] = (df["CP rate(%)"]*100).round(4)
-    df[['Coupon', 'CF', 'DC CF']] = df[['Coupon', 'CF', 'DC CF']].round(0).astype(int)
-    # dfF = df.applymap(format_number)
-    dfF = df.map(format_number)
-    
-
-    return dfF.reset_index()[["Coupon Date [yyyy-mm-dd]", 'X right', "Coupon", "CF", "DC CF", "CP rate(%)"]].copy(), ptd, df["CF"].sum(), sumdc, d_nxt, total_cash_in, prv_xdt
-
-def cashflow_for_reverse(selected_option, df4, df5, ccase, par, isd, mtd, trd, exr, cp1, cpR, cpk, cpkY, cpk2, frq):
-    if frq == "quarterly" :
-        frq = 3
-    elif frq == "annually" :
-        frq = 12
-    elif frq == "semi-annually" :
-        frq = 6
-    else :
-        raise Warning("Frequency => incorrect value")
-
-    d_set = trd + relativedelta(days=1)
-
-    # Generate the list of dates
-    l_payd = []
-    paydX = isd + relativedelta(months=frq)  # Start from the first increment
-    i = 1
-    while paydX < mtd:
-        # l_payd.append(paydX)
-        l_payd.append(isd + relativedelta(months=frq*i))
-        paydX = l_payd[-1]
-        i += 1
-
-    l_days = []
-    paydX = isd
-    for x in l_payd :
-        l_days.append((x-paydX).days)
-        paydX = x
-
-    data = {"d"      : l_days,
-            "Date"   : l_payd}
-    df = pd.DataFrame(data)
-    # calculate the coupons
-    # if FIXED
-    if ccase == 0 :
-        df["CP rate(%)"] = cp1
-
-    # if 1st year fixed, and the rest are ref
-    elif ccase == 1 :
-        r_grp = cpR.split(', ')
-        # Extract the year from the Date column in df
-        df['year'] = df['Date'].apply(lambda x: x.year)
-
-        # Calculate the average for each year in df4
-        df4['average'] = df4[r_grp].mean(axis=1)
-
-        # Merge df with df4 on the year
-        df = df.merge(df4[['year', 'average']], on='year', how='left')
-        
-        # Rename the average column to cppp
-        df.rename(columns={'average': 'CP rate(%)'}, inplace=True)
-
-        df.loc[:int(12/frq)-1, 'CP rate(%)'] = cp1 # 1st year fixed coupon!!!!
-        df.loc[int(12/frq):, 'CP rate(%)'] = df.loc[int(12/frq):, 'CP rate(%)'] + cpk
-
-    elif ccase == 2 :
-        r_grp = cpR.split(', ')
-        # Extract the year from the Date column in df
-        df['year'] = df['Date'].apply(lambda x: x.year)
-
-        # Calculate the average for each year in df4
-        df4['average'] = df4[r_grp].mean(axis=1)
-
-        # Merge df with df4 on the year
-        df = df.merge(df4[['year', 'average']], on='year', how='left')
-        
-        # Rename the average column to cppp
-        df.rename(columns={'average': 'CP rate(%)'}, inplace=True)
-
-        # df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] = cpk # 1st year fixed coupon!!!!
-        df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] = df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] + cpk
-        df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] = df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] + cpk2
-
-
-    # change df1.index[ind_a] to bcode.get()
-    # Check if b_code exists in df5['Bond_Code']
-    if selected_option in df5['Bond_Code'].values:
-        # Iterate over all rows in df5 with the given b_code
-        for _, row in df5[df5['Bond_Code'] == selected_option].iterrows():
-            coupon_date = row['Coupon_Date']
-            announced_rate = row['Announced_rate']
-            
-            # Update df['cppp'] where df['Date'] matches df5['Coupon_Date']
-            df.loc[df['Date'] == coupon_date, 'CP rate(%)'] = announced_rate
-
-
-    df["Coupon"] = par * df["CP rate(%)"] * df["d"] / 365
-    df["Coupon_int"] = df["Coupon"] * 0.55
-    df["CF"] = df["Coupon"]
-    df["CF_int"] = df["Coupon_int"]
-    df.loc[df.index[-1], 'CF'] = df.loc[df.index[-1], 'CF'] + par
-    df.loc[df.index[-1], 'CF_int'] = df.loc[df.index[-1], 'CF_int'] + par
-
-    df["Date"] = pd.to_datetime(df["Date"])
-    df['X right'] = df['Date'] - pd.offsets.BusinessDay(n=exr)
-
-    df["Date"] = df["Date"].dt.date
-    df['X right'] = df['X right'].dt.date
-
-    msk = df["X right"] >= d_set
-    df = df[msk].copy()
-
-
-    d_nxt = df.iloc[0]['Date']
-    
-    if l_payd.index(d_nxt) == 0 :
-        d_prv = isd
-    else :
-        d_prv = l_payd[l_payd.index(d_nxt) -1]
-
-    k = (( d_nxt - d_set ).days * frq ) / (12 * (d_nxt - d_prv).days) 
-    df = df.round(3)
-
-    return df[["Date", 'X right', "Coupon", "CF"]], df[["Date", "X right", "Coupon_int", "CF_int"]], frq, k
-
-def days_in_year(year):
-    """Return the number of days in a given year."""
-    return 366 if (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)) else 365
+    # The sheets now come through data_sources.py (Google Sheets by default,
+    # DATA_SOURCE=mongo or DATA_SOURCE=snapshot for a local copy)
+    # holidays first: the subscribers below and a shared copy's bond arrays are built on them (see calendars.py)
+    load_configured_holidays(data_source)
+    return data_source.load()
 
 def categorize_date_difference(date1, date2):
     """Categorize the difference between two dates."""
-    if date1 > date2:
-        date1, date2 = date2, date1  # Ensure date1 is the earlier date
-
-    days_difference = 0
-    current_date = date1
-
-    while current_date.year < date2.year:
-        days_difference += days_in_year(current_date.year)
-        current_date = current_date.replace(year=current_date.year + 1, month=1, day=1)
-
-    days_difference += (date2 - current_date).days
-
-    if days_difference < 365:
-        return 0.001 #0.1%
-    elif 365 <= days_difference < 730:
-        return 0.002 #0.2%
-    else:
-        return 0.003 #0.3%
+    # 0.1% under a year, 0.2% under two, 0.3% beyond; the year-by-year loop is now
+    # array arithmetic in pricing.fee_rates(), shared with the batch and series pricing
+    return float(fee_rates(date1, date2))
 
 # datastore_client = datastore.Client()
 
@@ -388,28 +48,102 @@ def categorize_date_difference(date1, date2):
 #     return times
 
 app = Flask(__name__)
+# request timing + GET /metrics; requests slower than SLOW_REQUEST_MS are logged with their spans
+metrics.init_app(app, slow_request_ms=float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None)
 # df1, df4, df5 = bring_mongo_dfs()
 
+# Sheets are loaded once per process and refreshed in the background (see data_store.py)
+ref_store = ReferenceDataStore(bring_the_dfs)
+
+@ref_store.subscribe
+def prepare_rates(data):
+    # reference-group averages and the announced-rate index are built once per refresh, not per request
+    projector_for(data.df4).prepare(data.df1["Coupon% Ref"])
+    announced_for(data.df5)
+
+# /update_data and /recalculate results, reused while the sheet contents don't change
+response_cache = ResponseCache()
+
+def build_price_grid(data, trd, reuse=None):
+    # home page + the /update_data answer of every code, for trade date trd;
+    # `reuse` holds the answers of the previous grid the last refresh didn't touch
+    df1, df4, df5 = data
+    reused = (reuse or {}).get("codes", {})
+    codes = {}
+    for code in df1.index:
+        if code in reused:
+            codes[code] = reused[code]
+            continue
+        try:
+            codes[code] = update_payload(df1, df4, df5, code, trd)
+        except Exception:
+            pass    # no coupon left, missing rates... the route computes it live and reports the error
+    try:
+        home = {None: home_context(df1, df4, df5, trd)}
+    except Exception:
+        home = {}
+    return {"home": home, "codes": codes}
+
+# every code valued once per day and per data version (see price_grid.py)
+price_grid = PriceGrid(build_price_grid)
+
+_previous = [None, None]    # data and holiday fingerprint of the last refresh
+
+@ref_store.subscribe
+def register_data_digest(data):
+    # the holidays move ex-right dates too, so they are part of what the results depend on
+    holidays = calendars.fingerprint()
+    digest = f"{data_digest(data.df1, data.df4, data.df5)}-{holidays}"
+    previous, previous_holidays = _previous
+    _previous[:] = data, holidays
+    carry = grid_carry = None
+    if previous is not None and previous_holidays == holidays:
+        # only the bonds the refresh touched are rebuilt and repriced (see dependencies.py)
+        changes = diff_refdata(previous, data)
+        if not changes.everything:
+            # old book first: both versions may share df1, and a book is looked up by df1
+            old_book = book_for(*previous)
+            book_for(*data).adopt(old_book, changes)
+            # ("update_data", code, trd) uses the sheet dates, ("recalculate", code, ...) the page's
+            carry = lambda key: not changes.affects(key[1], overridden=key[0] != "update_data")
+            grid_carry = (previous.version,
+                          lambda section, key: section == "codes" and not changes.affects(key))
+    response_cache.register(data.version, digest, carry=carry)
+    price_grid.rebuild_async(data, date.today(), digest, grid_carry)
+    price_grid.start(ref_store.get)
+
+@metrics.registry.collector
+def refdata_gauges():
+    info = schedule_cache_info()
+    return [("refdata_version", "Version of the reference data in memory", ref_store.version),
+            ("refdata_age_seconds", "Seconds since the reference data was loaded", ref_store.age()),
+            ("refdata_parse_errors", "Sheet rows skipped at the last load", len(data_source.parse_errors())),
+            ("schedule_cache_hits", "build_schedule LRU hits", info.hits),
+            ("schedule_cache_misses", "build_schedule LRU misses", info.misses),
+            ("schedule_cache_size", "Schedules in the build_schedule LRU", info.currsize),
+            ("calendar_generation", "Holiday calendar reloads that changed a calendar", calendars.generation)]
+
+@metrics.registry.collector
+def response_cache_gauges():
+    stats = response_cache.stats()
+    return [(f"response_cache_{name}", f"Response cache {name.replace('_', ' ')}", value)
+            for name, value in stats.items()]
+
 @app.route("/")
 def home():
-    df1, df4, df5 = bring_the_dfs()
+    data = ref_store.get()
     # df1, df4, df5 = bring_mongo_dfs()
+    trd = date.today()
+    context = price_grid.get(data, trd, "home", None) or home_context(*data, trd)
+    with span("serialize", bond=context["codes"][0]):
+        return render_template("home.html", **context)
+
+def home_context(df1, df4, df5, trd):
     ccase = return_ccase(df1.index[0], df1)
     selected_option = df1.index[0]
 
-    
-    par = df1.loc[selected_option, "Par value"]
-    isd = df1.loc[selected_option, "Issue Date"]
     mtd = df1.loc[selected_option, "Maturity Date"]
-    trd = date.today()
-    exr = df1.loc[selected_option, "Ex right day"]
-    cp1 = df1.loc[selected_option, "Coupon% 1"]
-    cpR = df1.loc[selected_option, "Coupon% Ref"]
-    cpk = df1.loc[selected_option, "Coupon% k1"]
-    frq = df1.loc[selected_option, "Coupon payment"]
     pry = df1.loc[selected_option, "Price Yield"]
-    cpkY= df1.loc[selected_option, "k1 years"]
-    cpk2= df1.loc[selected_option, "Coupon% k2"]
 
     yrdf = df1['Maturity Date'][selected_option].year - df1['Issue Date'][selected_option].year
     exp = "["+ df1["Coupon Type"][selected_option] +"]     "
@@ -429,49 +163,64 @@ def home():
 
     # Fetch the most recent 10 access times from Datastore.
     # times = fetch_times(10)
-    d_send = df1.iloc[[0]].to_dict(orient="records")
+    d_send = [row_record(df1, selected_option)]
 
 
-    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = cashflow(df4=df4, df5=df5, selected_option=selected_option, ccase = ccase, par=par, isd=isd, mtd=mtd, trd=trd, exr=exr, cp1=cp1, cpR=cpR, cpk=cpk, cpkY=cpkY, cpk2=cpk2, frq=frq, pry=pry)
-    cfT_col = cfT.columns.tolist()
-    cfT_rec = cfT.to_dict(orient='records')
+    # the Bond (schedule + coupons) is built once per data version and reused
+    bond = book_for(df1, df4, df5).get(selected_option)
+    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = bond.cashflow(trd, pry)
+    cfT_col = CF_COLUMNS
 
     fee_trd = categorize_date_difference(trd, mtd)
     tot_investment = (1+fee_trd) * ptd
     abr = (total_cash_input - tot_investment) / tot_investment / (mtd - trd).days * 365.25
     abr = str(round(abr*100, 2))
 
-    return render_template("home.html", codes=df1.index.tolist(), d_send=d_send, exp = exp, cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt, abr=abr, prv_xdt=prv_xdt)
+    cfT_rec = cashflow_records(cfT)
+    return dict(codes=df1.index.tolist(), d_send=d_send, exp = exp, cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt, abr=abr, prv_xdt=prv_xdt)
     
+@app.route("/_ah/warmup")
+def warmup():
+    # App Engine calls this before sending traffic to a new instance (inbound_services: warmup in app.yaml):
+    # load the sheets, build every bond and compile the page template so the first user request doesn't
+    data = ref_store.get()
+    book = book_for(*data)
+    for code in data.df1.index:
+        try:
+            book.get(code)
+        except Exception:
+            pass    # a bond the sheet can't build fails the same way on its own request
+    app.jinja_env.get_template("home.html")
+    return "", 200
+
 @app.route("/about")
 def about():
     return render_template("about.html")
 
 @app.route('/update_data', methods=['POST'])
 def update_data():
-    df1, df4, df5 = bring_the_dfs()
+    data = ref_store.get()
     # df1, df4, df5 = bring_mongo_dfs()
     selected_option = request.json.get('selected_option')
+    trd = date.today()
+
+    # today's grid first (price_grid.py), then the same bond/day/sheets answer (response_cache.py)
+    payload = price_grid.get(data, trd, "codes", selected_option)
+    if payload is None:
+        payload = response_cache.get_or_compute(data.version, ("update_data", selected_option, trd),
+                                                lambda: update_payload(*data, selected_option, trd))
+    # the code list (the page's dropdown) is the same for every bond: added here, not stored per code
+    with span("serialize", bond=selected_option):
+        return jsonify(codes=data.df1.index.tolist(), **payload)
+
+def update_payload(df1, df4, df5, selected_option, trd):
     ccase = return_ccase(selected_option, df1)
 
-    par = df1.loc[selected_option, "Par value"]
-    isd = df1.loc[selected_option, "Issue Date"]
     mtd = df1.loc[selected_option, "Maturity Date"]
-    trd = date.today()
-    exr = df1.loc[selected_option, "Ex right day"]
-    cp1 = df1.loc[selected_option, "Coupon% 1"]
-    cpR = df1.loc[selected_option, "Coupon% Ref"]
-    cpk = df1.loc[selected_option, "Coupon% k1"]
-    frq = df1.loc[selected_option, "Coupon payment"]
     pry = df1.loc[selected_option, "Price Yield"]
-    cpkY= df1.loc[selected_option, "k1 years"]
-    cpk2= df1.loc[selected_option, "Coupon% k2"]
 
     yrdf = df1['Maturity Date'][selected_option].year - df1['Issue Date'][selected_option].year
 
-    df1['Issue Date'] = df1['Issue Date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    df1['Maturity Date'] = df1['Maturity Date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-
     exp = "["+ str(df1["Coupon Type"][selected_option]) +"]     "
     if ccase == 0:
         exp += str(df1["Coupon% 1"][selected_option] * 100) + f"% annual coupon rate for all period nha"
@@ -483,15 +232,17 @@ def update_data():
         else :
             exp += str(int(df1["k1 years"][selected_option])) + "years with annual coupon rate of [" + str(df1["Coupon% Ref"][selected_option]) + " + " + str(round(df1["Coupon% k1"][selected_option] * 100, 3)) + f"%]. Then [Ref. + " + str(round(df1["Coupon% k2"][selected_option] * 100, 3)) + f"%] for the rest. nha"
 
-    d_send = df1.loc[[selected_option]].to_dict(orient="records")
+    # df1 is shared between requests now, so format the dates on a copy
+    d_row = row_record(df1, selected_option)
+    d_row['Issue Date'] = d_row['Issue Date'].strftime('%Y-%m-%d')
+    d_row['Maturity Date'] = d_row['Maturity Date'].strftime('%Y-%m-%d')
+    d_send = [d_row]
 
     # print(df4)
     # return
-    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = cashflow(df4=df4, df5=df5, selected_option=selected_option, ccase = ccase, par=par, isd=isd, mtd=mtd, trd=trd, exr=exr, cp1=cp1, cpR=cpR, cpk=cpk, cpkY=cpkY, cpk2=cpk2, frq=frq, pry=pry)
-    cfT['Coupon Date [yyyy-mm-dd]'] = cfT['Coupon Date [yyyy-mm-dd]'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    cfT['X right'] = cfT['X right'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    cfT_col = cfT.columns.tolist()
-    cfT_rec = cfT.to_dict(orient='records')
+    bond = book_for(df1, df4, df5).get(selected_option)
+    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = bond.cashflow(trd, pry)
+    cfT_col = CF_COLUMNS
 
     fee_trd = categorize_date_difference(trd, mtd)
     tot_investment = (1+fee_trd) * ptd
@@ -499,14 +250,14 @@ def update_data():
     abr = str(round(abr*100, 2))
 
     # new_data = data.get(selected_option, 'No data available')  # Fetch the data based on the selected option
-    return jsonify(new_data=selected_option, codes=df1.index.tolist(), d_send=d_send, exp=exp, cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt.strftime('%Y-%m-%d'), abr=abr, prv_xdt=prv_xdt.strftime('%Y-%m-%d'))
+    cfT_rec = cashflow_records(cfT)
+    return dict(new_data=selected_option, d_send=d_send, exp=exp, cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt.strftime('%Y-%m-%d'), abr=abr, prv_xdt=prv_xdt.strftime('%Y-%m-%d'))
 
 @app.route('/recalculate', methods=['POST'])
 def recalculate():
-    df1, df4, df5 = bring_the_dfs()
+    data = ref_store.get()
     # df1, df4, df5 = bring_mongo_dfs()
     selected_option = request.json.get('resultCode')
-    ccase = return_ccase(selected_option, df1)
 
     # par = df1.loc[selected_option, "Par value"]
     par = int(request.json.get('parvalu')) # integer
@@ -528,17 +279,19 @@ def recalculate():
     frq = request.json.get('freqncy')
     # pry = df1.loc[selected_option, "Price Yield"]
     pry = float(request.json.get('prcyld')) / 100
-    cp1 = df1.loc[selected_option, "Coupon% 1"]
-    cpR = df1.loc[selected_option, "Coupon% Ref"]
-    cpk = df1.loc[selected_option, "Coupon% k1"]
-    cpkY= df1.loc[selected_option, "k1 years"]
-    cpk2= df1.loc[selected_option, "Coupon% k2"]
-
-    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = cashflow(df4=df4, df5=df5, selected_option=selected_option, ccase = ccase, par=par, isd=isd, mtd=mtd, trd=trd, exr=exr, cp1=cp1, cpR=cpR, cpk=cpk, cpkY=cpkY, cpk2=cpk2, frq=frq, pry=pry)
-    cfT['Coupon Date [yyyy-mm-dd]'] = cfT['Coupon Date [yyyy-mm-dd]'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    cfT['X right'] = cfT['X right'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    cfT_col = cfT.columns.tolist()
-    cfT_rec = cfT.to_dict(orient='records')
+
+    # keyed by the parsed inputs, so '' and today's date share an entry
+    key = ("recalculate", selected_option, par, isd, mtd, trd, exr, frq, pry)
+    payload = response_cache.get_or_compute(data.version, key,
+                                            lambda: recalculate_payload(*data, selected_option, par, isd, mtd, trd, exr, frq, pry))
+    with span("serialize", bond=selected_option):
+        return jsonify(**payload)
+
+def recalculate_payload(df1, df4, df5, selected_option, par, isd, mtd, trd, exr, frq, pry):
+    # the coupon terms come from df1, the rest from the page
+    bond = book_for(df1, df4, df5).get(selected_option, par=par, isd=isd, mtd=mtd, exr=exr, frq=frq)
+    cfT, ptd, sumcf, sumdc, d_nxt, total_cash_input, prv_xdt = bond.cashflow(trd, pry)
+    cfT_col = CF_COLUMNS
 
     fee_trd = categorize_date_difference(trd, mtd)
     tot_investment = (1+fee_trd) * ptd
@@ -546,11 +299,12 @@ def recalculate():
     abr = str(round(abr*100, 2))
     
     # return jsonify(new_data=selected_option, codes=df1.index.tolist(), d_send=d_send, exp=exp, cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt.strftime('%Y-%m-%d'))
-    return jsonify(cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt.strftime('%Y-%m-%d'), abr=abr, prv_xdt=prv_xdt.strftime('%Y-%m-%d'))
+    cfT_rec = cashflow_records(cfT)
+    return dict(cfT_col=cfT_col, cfT_rec=cfT_rec, ptd=int(ptd), d_nxt=d_nxt.strftime('%Y-%m-%d'), abr=abr, prv_xdt=prv_xdt.strftime('%Y-%m-%d'))
 
 @app.route('/reverso', methods=['POST'])
 def reverso():
-    df1, df4, df5 = bring_the_dfs()
+    df1, df4, df5 = ref_store.get()
     # df1, df4, df5 = bring_mongo_dfs()
     selected_option = request.json.get('resultCode')
     ccase = return_ccase(selected_option, df1)
@@ -565,23 +319,237 @@ def reverso():
     exr = int(request.json.get('exrtday'))
     frq = request.json.get('freqncy')
     # pry = float(request.json.get('prcyld')) / 100 #skip Price Yield for the reverso
-    cp1 = df1.loc[selected_option, "Coupon% 1"]
-    cpR = df1.loc[selected_option, "Coupon% Ref"]
-    cpk = df1.loc[selected_option, "Coupon% k1"]
-    cpkY= df1.loc[selected_option, "k1 years"]
-    cpk2= df1.loc[selected_option, "Coupon% k2"]
 
     ### Different to Recalculate from this point on
-    ttt, ttt_i, fr1, k = cashflow_for_reverse(selected_option, df4, df5, ccase, par, isd, mtd, trd, exr, cp1, cpR, cpk, cpkY, cpk2, frq)
-    ttt_i.rename(columns={"Coupon_int": "Coupon", "CF_int": "CF"}, inplace=True)
+    bond = book_for(df1, df4, df5).get(selected_option, par=par, isd=isd, mtd=mtd, exr=exr, frq=frq)
 
     initial_guess = 0.07
-    trading_price = float(request.json.get('reverso'))
+    # 'reverso' is one trading price, or a list of them for a whole price ladder
+    trading_price = request.json.get('reverso')
+    ladder = isinstance(trading_price, list)
+    prices = np.array([float(p) for p in trading_price] if ladder else [float(trading_price)])
+
+    # pre-tax, and after-tax (coupons * 0.55) cash flows
+    pry_solution = bond.solve_yield(trd, prices, guess=initial_guess) * 100
+    pry_solution_int = bond.solve_yield(trd, prices, after_tax=True, guess=initial_guess/2) * 100
+
+    # NaN where no yield reproduces the price (the solver found no bracket): null and an error
+    solved = bool(np.isfinite(pry_solution).all() and np.isfinite(pry_solution_int).all())
+    extra = {} if solved else {"error": "no yield reproduces this price"}
+    if ladder:
+        return jsonify(pry_solution=finite_list(pry_solution), pry_solution_int=finite_list(pry_solution_int), **extra)
+    return jsonify(pry_solution=finite_list(pry_solution)[0], pry_solution_int=finite_list(pry_solution_int)[0], **extra)
+
+MAX_LADDER_POINTS = 2001
+
+def route_overrides(body):
+    # the optional /recalculate overrides of /ladder and /abr_series; ValueError/TypeError on a malformed one
+    return dict(
+        par=int(body['parvalu']) if body.get('parvalu') else None,
+        isd=datetime.strptime(body['isudate'], "%Y-%m-%d").date() if body.get('isudate') else None,
+        mtd=datetime.strptime(body['matdate'], "%Y-%m-%d").date() if body.get('matdate') else None,
+        exr=int(body['exrtday']) if body.get('exrtday') not in (None, '') else None,
+        frq=body.get('freqncy') or None,
+    )
+
+def finite_list(values):
+    # JSON has no NaN/Infinity: those go out as null
+    return [v if np.isfinite(v) else None for v in np.asarray(values, dtype=float).tolist()]
+
+@app.route('/ladder', methods=['POST'])
+def ladder():
+    # Dirty price, modified duration, convexity and DV01 over a whole yield grid in one call.
+    # {"resultCode": .., "from": 5, "to": 9, "step": 0.25} or {"resultCode": .., "yields": [5, 6.5, 8]}, yields in %;
+    # trddte and the /recalculate overrides (parvalu, isudate, matdate, exrtday, freqncy) are optional.
+    df1, df4, df5 = ref_store.get()
+    body = request.get_json(silent=True) or {}
+    selected_option = body.get('resultCode')
+    if selected_option not in df1.index:
+        return jsonify(error="unknown code", code=selected_option), 400
 
-    pry_solution = newton(target_function, initial_guess, args=(ttt, trading_price, fr1, k)) * 100
-    pry_solution_int = newton(target_function, initial_guess/2, args=(ttt_i, trading_price, fr1, k)) * 100
+    try:
+        trd = datetime.strptime(body['trddte'], "%Y-%m-%d").date() if body.get('trddte') else date.today()
+        overrides = route_overrides(body)
+        if body.get('yields') is not None:
+            yields = np.array([float(y) for y in body['yields']]) / 100
+        else:
+            lo, hi, step = float(body.get('from', 0)), float(body.get('to', 0)), float(body.get('step', 0))
+    except (TypeError, ValueError):
+        return jsonify(error="bad input: dates are yyyy-mm-dd, yields/from/to/step numbers"), 400
+
+    if body.get('yields') is not None:
+        if not np.isfinite(yields).all():
+            return jsonify(error="yields must be finite numbers"), 400
+    else:
+        if not np.isfinite([lo, hi, step]).all() or step <= 0 or hi < lo:
+            return jsonify(error="need from <= to and step > 0 (in %), or a yields list"), 400
+        n = int(np.floor((hi - lo) / step + 1e-9)) + 1
+        if n > MAX_LADDER_POINTS:
+            return jsonify(error=f"at most {MAX_LADDER_POINTS} yields per ladder"), 400
+        yields = (lo + step * np.arange(n)) / 100
+    if len(yields) > MAX_LADDER_POINTS:
+        return jsonify(error=f"at most {MAX_LADDER_POINTS} yields per ladder"), 400
 
-    return jsonify(pry_solution = pry_solution, pry_solution_int=pry_solution_int)
+    try:
+        bond = book_for(df1, df4, df5).get(selected_option, **overrides)
+    except BUILD_ERRORS as e:
+        return jsonify(error=f"cannot build bond: {e}"), 400
+    try:
+        lad = bond.ladder(trd, yields)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400   # no coupon left after trd
+    with span("serialize", bond=selected_option):
+        return jsonify(code=selected_option, trade_date=trd.strftime('%Y-%m-%d'),
+                       yields=np.round(lad.yields * 100, 10).tolist(), ptd=finite_list(lad.ptd),
+                       duration=finite_list(lad.duration), convexity=finite_list(lad.convexity),
+                       dv01=finite_list(lad.dv01))
+
+MAX_SERIES_POINTS = 20000
+
+@app.route('/abr_series', methods=['POST'])
+def abr_series():
+    # ptd, abr and the fee bracket over a range of trade dates, in one vectorized pass over the bond's schedule.
+    # {"resultCode": .., "from": "2025-01-01", "to": "2030-01-01", "step": 1} (dates default to today .. the day
+    # before maturity, step in days); prcyld (in %) and the /recalculate overrides are optional.
+    df1, df4, df5 = ref_store.get()
+    body = request.get_json(silent=True) or {}
+    selected_option = body.get('resultCode')
+    if selected_option not in df1.index:
+        return jsonify(error="unknown code", code=selected_option), 400
+
+    try:
+        overrides = route_overrides(body)
+        pry = float(body['prcyld']) / 100 if body.get('prcyld') not in (None, '') else float(df1.loc[selected_option, "Price Yield"])
+        start = datetime.strptime(body['from'], "%Y-%m-%d").date() if body.get('from') else date.today()
+        end = datetime.strptime(body['to'], "%Y-%m-%d").date() if body.get('to') else None
+        step = int(body['step']) if body.get('step') not in (None, '') else 1
+    except (TypeError, ValueError):
+        return jsonify(error="bad input: dates are yyyy-mm-dd, prcyld a number, step whole days"), 400
+    if not np.isfinite(pry):
+        return jsonify(error="prcyld must be a finite number"), 400
+    try:
+        bond = book_for(df1, df4, df5).get(selected_option, **overrides)
+    except BUILD_ERRORS as e:
+        return jsonify(error=f"cannot build bond: {e}"), 400
+
+    start = np.datetime64(start, 'D')
+    end = np.datetime64(end, 'D') if end is not None else np.datetime64(bond.mtd, 'D') - 1
+    if step <= 0 or end < start:
+        return jsonify(error="need from <= to and step > 0 (in days)"), 400
+    if (end - start).astype(np.int64) // step + 1 > MAX_SERIES_POINTS:
+        return jsonify(error=f"at most {MAX_SERIES_POINTS} trade dates per series"), 400
+    trade_dates = np.arange(start, end + 1, step)
+
+    with span("price_series", bond=selected_option):
+        res = price_series(bond, trade_dates, pry)
+    # null where nothing is left to pay, or where the figure isn't finite (a yield of -100% or below)
+    ok = res["has_cf"]
+    ok_ptd = ok & np.isfinite(res["ptd"])
+    ok_abr = ok & np.isfinite(res["abr"])
+    with span("serialize", bond=selected_option):
+        return jsonify(code=selected_option, price_yield=round(pry * 100, 10),
+                       trade_dates=trade_dates.astype(str).tolist(),
+                       ptd=[int(p) if k else None for p, k in zip(res["ptd"].tolist(), ok_ptd)],
+                       abr=[str(round(a * 100, 2)) if k else None for a, k in zip(res["abr"].tolist(), ok_abr)],
+                       fee=finite_list(np.round(res["fee"] * 100, 1)),
+                       d_nxt=[str(np.datetime64(int(d), 'D')) if k else None for d, k in zip(res["d_nxt"].tolist(), ok)])
+
+@app.route('/scenarios', methods=['POST'])
+def scenarios_route():
+    # Reprice the book under rate shocks of the Interest curve (see scenarios.py):
+    # {"scenarios": [{"name": "+50bp", "parallel_bp": 50}, {"name": "steepen", "slope_bp": 10},
+    #                {"name": "BIDV -100", "columns_bp": {"BIDV": -100}}, {"years_bp": {"2027": 25}}],
+    #  "codes": [...], "trade_date": "yyyy-mm-dd"}  (codes / trade_date optional)
+    df1, df4, df5 = ref_store.get()
+    body = request.get_json(silent=True) or {}
+    try:
+        shocks = [shock_from_json(d, i) for i, d in enumerate(body.get('scenarios') or [])]
+    except (TypeError, ValueError, AttributeError):
+        return jsonify(error="bad scenario"), 400
+    if len(shocks) > MAX_SCENARIOS:
+        return jsonify(error=f"at most {MAX_SCENARIOS} scenarios"), 400
+    codes = body.get('codes') or df1.index.tolist()
+    unknown = [c for c in codes if c not in df1.index]
+    if unknown:
+        return jsonify(error="unknown codes", codes=unknown), 400
+    trd = datetime.strptime(body['trade_date'], "%Y-%m-%d").date() if body.get('trade_date') else date.today()
+
+    codes, names, ptd, abr = reprice_scenarios(df1, df4, df5, shocks, codes=codes, trd=trd)
+    with span("serialize"):
+        # bonds x scenarios, base curve first; null where the bond has nothing left to pay
+        return jsonify(codes=codes, scenarios=names, trade_date=trd.strftime('%Y-%m-%d'),
+                       ptd=[[None if np.isnan(v) else int(v) for v in row] for row in ptd],
+                       abr=[[None if np.isnan(v) else round(v * 100, 2) for v in row] for row in abr])
+
+@app.route('/portfolio', methods=['POST'])
+def portfolio_route():
+    # Value a holdings file (CSV or NDJSON, as the body or a multipart "file") and stream
+    # one NDJSON result per position back while reading it (see portfolio.py)
+    data = ref_store.get()
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = request.args.get('format') or guess_format(upload.filename or "", upload.mimetype)
+        # Flask closes the parsed upload when the view returns, before the response is streamed
+        stream = tempfile.TemporaryFile()
+        shutil.copyfileobj(upload.stream, stream)
+        stream.seek(0)
+    else:
+        fmt = request.args.get('format') or guess_format(content_type=request.content_type)
+        stream = request.stream
+    positions = read_positions(text_lines(stream), fmt)
+    return Response(stream_with_context(ndjson(value_positions(*data, positions))),
+                    mimetype='application/x-ndjson')
+
+REFRESH_MIN_INTERVAL = float(os.environ.get('REFRESH_MIN_INTERVAL', '10'))   # seconds between manual reloads
+
+@app.route('/refresh_data', methods=['POST'])
+def refresh_data():
+    # Manual invalidation of the cached sheets, e.g. right after editing the spreadsheet
+    # off unless REFRESH_TOKEN is set: every call is a Sheets fetch
+    token = os.environ.get('REFRESH_TOKEN')
+    if not token:
+        return jsonify(error="refresh disabled, REFRESH_TOKEN is not configured"), 403
+    if request.headers.get('X-Refresh-Token') != token:
+        return jsonify(error="forbidden"), 403
+    age = ref_store.age()
+    if age is not None and age < REFRESH_MIN_INTERVAL:
+        # just reloaded, the sheets can't have moved much; don't let a retry loop burn the quota
+        return jsonify(version=ref_store.version, stale=ref_store.is_stale(), skipped=True)
+    if hasattr(data_source, 'expire'):
+        data_source.expire()    # the shared copy of the other workers is as old as ours (see shared_data.py)
+    data = ref_store.invalidate(wait=request.args.get('wait') == '1')
+    return jsonify(version=data.version, stale=ref_store.is_stale())
+
+@app.route('/data_errors')
+def data_errors():
+    # sheet rows skipped at the last load because they didn't parse (see sheet_schema.py)
+    ref_store.get()
+    return jsonify(errors=[dict(e._asdict(), value=str(e.value)) for e in data_source.parse_errors()])
+
+@app.route('/price_batch', methods=['POST'])
+def price_batch_route():
+    # Whole universe (or the given codes) x one or more trade dates in one call
+    df1, df4, df5 = ref_store.get()
+    body = request.get_json(silent=True) or {}
+    codes = body.get('codes') or df1.index.tolist()
+    unknown = [c for c in codes if c not in df1.index]
+    if unknown:
+        return jsonify(error="unknown codes", codes=unknown), 400
+    trade_dates = [datetime.strptime(d, "%Y-%m-%d").date() for d in body.get('trade_dates', [])] or [date.today()]
+
+    with span("price_batch"):
+        res = price_batch(df1, df4, df5, codes=codes, trade_dates=trade_dates)
+    results = []
+    for row in res.itertuples(index=False):
+        results.append({
+            "code": row.code,
+            "trade_date": row.trade_date.strftime('%Y-%m-%d'),
+            "ptd": None if np.isnan(row.ptd) else int(row.ptd),
+            "abr": None if np.isnan(row.abr) else str(round(row.abr*100, 2)),
+            "d_nxt": None if row.d_nxt is None else row.d_nxt.strftime('%Y-%m-%d'),
+            "prv_xdt": None if row.prv_xdt is None else row.prv_xdt.strftime('%Y-%m-%d'),
+        })
+    return jsonify(results=results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Hot-path instrumentation: timing spans, histograms and counters, exported in
+# the Prometheus text format by the /metrics route.
+#
+#   with span("discount", bond=code):
+#       ...
+#
+# Spans are recorded in the `pricing_span_seconds` histogram labelled with the
+# span name and the route of the current request, and are also kept per request
+# (with the bond) so a slow request can be logged with its breakdown. The bond
+# is not a label: one series per bond would grow with the universe.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}     # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, entry in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', '+Inf')])} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() -> [(name, help, value)] gauges read at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.expose()
+        for fn in self._collectors:
+            try:
+                gauges = fn()
+            except Exception:
+                logger.exception("metrics collector failed")
+                continue
+            for name, help, value in gauges:
+                if value is None or (isinstance(value, float) and not math.isfinite(value)):
+                    continue
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "Flask request latency", ("route", "status"))
+SPAN_SECONDS = registry.histogram("pricing_span_seconds", "Time spent in one pricing stage",
+                                  ("span", "route"))
+CACHE_EVENTS = registry.counter("cache_events_total", "Cache lookups by cache and result (hit/miss)",
+                                ("cache", "result"))
+SHEETS_CALLS = registry.counter("sheets_api_calls_total", "Google Sheets API calls", ("call",))
+SOLVER_ITERATIONS = registry.counter("solver_iterations_total", "Newton iterations of the yield solver")
+SOLVER_FALLBACKS = registry.counter("solver_fallbacks_total", "Yield problems handed to Brent after Newton failed")
+
+
+def cache_hit(cache):
+    CACHE_EVENTS.inc(cache=cache, result="hit")
+
+
+def cache_miss(cache):
+    CACHE_EVENTS.inc(cache=cache, result="miss")
+
+
+class RequestTrace:
+    """Spans of one request, for the slow-request log."""
+    __slots__ = ("route", "request_id", "started", "spans")
+
+    def __init__(self, route, request_id):
+        self.route = route
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def breakdown(self):
+        """Total seconds per span name."""
+        out = {}
+        for name, _, seconds in self.spans:
+            out[name] = out.get(name, 0.0) + seconds
+        return out
+
+
+def start_request(route, request_id):
+    trace = RequestTrace(route, request_id)
+    return trace, _request.set(trace)
+
+
+def end_request(token):
+    _request.reset(token)
+
+
+def current_route():
+    trace = _request.get()
+    return trace.route if trace is not None else ""
+
+
+@contextmanager
+def span(name, bond=""):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        trace = _request.get()
+        SPAN_SECONDS.observe(seconds, span=name, route=trace.route if trace else "")
+        if trace is not None:
+            trace.spans.append((name, bond, seconds))
+
+
+def init_app(app, slow_request_ms=None):
+    """Time every request, log slow ones with their span breakdown, serve /metrics."""
+    from flask import Response, g, request
+    import uuid
+
+    @app.before_request
+    def _start_trace():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex[:12]
+        g._metrics_trace, g._metrics_token = start_request(route, request_id)
+
+    @app.after_request
+    def _record(response):
+        trace = g.pop("_metrics_trace", None)
+        if trace is not None:
+            seconds = time.perf_counter() - trace.started
+            REQUEST_SECONDS.observe(seconds, route=trace.route, status=response.status_code)
+            if slow_request_ms is not None and seconds * 1e3 >= slow_request_ms:
+                parts = ", ".join(f"{k}={v * 1e3:.1f}ms" for k, v in sorted(trace.breakdown().items()))
+                logger.warning("slow request %s %s %.1fms [%s]", trace.request_id, trace.route, seconds * 1e3, parts)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        token = g.pop("_metrics_token", None)
+        if token is not None:
+            end_request(token)
+
+    @app.route("/metrics")
+    def metrics_route():
+        return Response(registry.expose(), mimetype="text/plain; version=0.0.4")
+
+    return app
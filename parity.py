@@ -0,0 +1,253 @@
+import argparse
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from scipy.optimize import newton
+
+from bond import book_for, cashflow_records, return_ccase
+from data_sources import SnapshotSource
+
+# Parity check: the NumPy Bond kernel against the original pandas cashflow() /
+# cashflow_for_reverse() + newton (frozen below, only their copy-pasted first half
+# shared), for every bond of a snapshot and a range of trade dates.
+#
+#   python parity.py snapshot.sqlite --start 2025-01-01 --days 30 --count 24
+#
+# Prints every mismatching (code, trade date) and exits with 1 if there are any.
+
+
+def _legacy_frame(df4, df5, selected_option, ccase, isd, mtd, trd, cp1, cpR, cpk, cpkY, cpk2, frq):
+    # the part both original functions had copy-pasted: dates, days and coupon rates
+    df4 = df4.copy()    # the original wrote df4['average'] into the shared frame
+    if frq == "quarterly" :
+        frq = 3
+    elif frq == "annually" :
+        frq = 12
+    elif frq == "semi-annually" :
+        frq = 6
+    else :
+        raise Warning("Frequency => incorrect value")
+
+    d_set = trd + relativedelta(days=1)
+
+    l_payd = []
+    paydX = isd + relativedelta(months=frq)
+    i = 1
+    while paydX < mtd:
+        l_payd.append(isd + relativedelta(months=frq*i))
+        paydX = l_payd[-1]
+        i += 1
+
+    l_days = []
+    paydX = isd
+    for x in l_payd :
+        l_days.append((x-paydX).days)
+        paydX = x
+
+    df = pd.DataFrame({"d": l_days, "Date": l_payd})
+    if ccase == 0 :
+        df["CP rate(%)"] = cp1
+    elif ccase in (1, 2) :
+        r_grp = cpR.split(', ')
+        df['year'] = df['Date'].apply(lambda x: x.year)
+        df4['average'] = df4[r_grp].mean(axis=1)
+        df = df.merge(df4[['year', 'average']], on='year', how='left')
+        df.rename(columns={'average': 'CP rate(%)'}, inplace=True)
+        if ccase == 1 :
+            df.loc[:int(12/frq)-1, 'CP rate(%)'] = cp1
+            df.loc[int(12/frq):, 'CP rate(%)'] = df.loc[int(12/frq):, 'CP rate(%)'] + cpk
+        else :
+            df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] = df.loc[:int(cpkY * 12/frq) - 1, 'CP rate(%)'] + cpk
+            df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] = df.loc[int(cpkY * 12/frq):, 'CP rate(%)'] + cpk2
+
+    if selected_option in df5['Bond_Code'].values:
+        for _, row in df5[df5['Bond_Code'] == selected_option].iterrows():
+            df.loc[df['Date'] == row['Coupon_Date'], 'CP rate(%)'] = row['Announced_rate']
+
+    return df, l_payd, frq, d_set
+
+
+def legacy_cashflow(df4, df5, selected_option, ccase, par, isd, mtd, trd, exr, cp1, cpR, cpk, cpkY, cpk2, frq, pry):
+    df, l_payd, frq, d_set = _legacy_frame(df4, df5, selected_option, ccase, isd, mtd, trd, cp1, cpR, cpk, cpkY, cpk2, frq)
+
+    df["Coupon"] = par * df["CP rate(%)"] * df["d"] / 365
+
+    df["Coupon Date [yyyy-mm-dd]"] = pd.to_datetime(df["Date"])
+    df['X right'] = df['Coupon Date [yyyy-mm-dd]'] - pd.offsets.BusinessDay(n=exr)
+    df["Coupon Date [yyyy-mm-dd]"] = df["Coupon Date [yyyy-mm-dd]"].dt.date
+    df['X right'] = df['X right'].dt.date
+
+    prv_xdt = df[df['X right'] < d_set]['X right'].max()
+
+    msk = df["X right"] >= d_set
+    df = df[msk].copy()
+    df['i'] = range(len(df))
+
+    df["CF"] = df["Coupon"]
+    df.loc[df.index[-1], 'CF'] = df.loc[df.index[-1], 'CF'] + par
+    df["DC CF"] = df["CF"] / (1 + pry * frq / 12)**df["i"]
+
+    total_cash_in = df["Coupon"].sum() * 0.95 + par
+
+    sumdc = df["DC CF"].sum()
+    d_nxt = df.iloc[0]['Date']
+
+    if l_payd.index(d_nxt) == 0 :
+        d_prv = isd
+    else :
+        d_prv = l_payd[l_payd.index(d_nxt) -1]
+
+    ptd = sumdc / (1 + (( d_nxt - d_set ).days * pry * frq ) / (12 * (d_nxt - d_prv).days) )
+
+    df["CP rate(%)"] = (df["CP rate(%)"]*100).round(4)
+    df[['Coupon', 'CF', 'DC CF']] = df[['Coupon', 'CF', 'DC CF']].round(0).astype(int)
+    dfF = df.map(lambda x: "{:,}".format(x) if isinstance(x, (int, float)) else x)
+
+    cfT = dfF.reset_index()[["Coupon Date [yyyy-mm-dd]", 'X right', "Coupon", "CF", "DC CF", "CP rate(%)"]].copy()
+    return cfT, ptd, df["CF"].sum(), sumdc, d_nxt, total_cash_in, prv_xdt
+
+
+def legacy_cashflow_for_reverse(selected_option, df4, df5, ccase, par, isd, mtd, trd, exr, cp1, cpR, cpk, cpkY, cpk2, frq):
+    df, l_payd, frq, d_set = _legacy_frame(df4, df5, selected_option, ccase, isd, mtd, trd, cp1, cpR, cpk, cpkY, cpk2, frq)
+
+    df["Coupon"] = par * df["CP rate(%)"] * df["d"] / 365
+    df["Coupon_int"] = df["Coupon"] * 0.55
+    df["CF"] = df["Coupon"]
+    df["CF_int"] = df["Coupon_int"]
+    df.loc[df.index[-1], 'CF'] = df.loc[df.index[-1], 'CF'] + par
+    df.loc[df.index[-1], 'CF_int'] = df.loc[df.index[-1], 'CF_int'] + par
+
+    df["Date"] = pd.to_datetime(df["Date"])
+    df['X right'] = df['Date'] - pd.offsets.BusinessDay(n=exr)
+    df["Date"] = df["Date"].dt.date
+    df['X right'] = df['X right'].dt.date
+
+    msk = df["X right"] >= d_set
+    df = df[msk].copy()
+
+    d_nxt = df.iloc[0]['Date']
+
+    if l_payd.index(d_nxt) == 0 :
+        d_prv = isd
+    else :
+        d_prv = l_payd[l_payd.index(d_nxt) -1]
+
+    k = (( d_nxt - d_set ).days * frq ) / (12 * (d_nxt - d_prv).days)
+    df = df.round(3)
+
+    return df[["Date", 'X right', "Coupon", "CF"]], df[["Date", "X right", "Coupon_int", "CF_int"]], frq, k
+
+
+def legacy_reverso(ttt, trading_price, frq, k, initial_guess):
+    # calculate_trading_price / target_function / newton from the original /reverso
+    def target_function(pry):
+        ttt['i'] = range(len(ttt))
+        ttt["DC CF"] = ttt["CF"] / (1 + pry * frq / 12)**ttt["i"]
+        return ttt["DC CF"].sum() / (1 + k * pry) - trading_price
+
+    return newton(target_function, initial_guess)
+
+
+def _legacy_records(cfT):
+    return [{col: (val.strftime('%Y-%m-%d') if isinstance(val, date) else val) for col, val in row.items()}
+            for row in cfT.to_dict(orient='records')]
+
+
+def _same(a, b, rel=1e-9):
+    return abs(a - b) <= rel * max(1.0, abs(a), abs(b))
+
+
+def check(df1, df4, df5, trade_dates, verbose=False):
+    """Compare every bond x trade date. Returns (n_checked, mismatches, timings)."""
+    book = book_for(df1, df4, df5)
+    mismatches = []
+    t_new, t_old = [], []
+    n = 0
+    for code in df1.index:
+        row = df1.loc[code]
+        ccase = return_ccase(code, df1)
+        bond = book.get(code)
+        for trd in trade_dates:
+            args = (ccase, row["Par value"], row["Issue Date"], row["Maturity Date"], trd, row["Ex right day"],
+                    row["Coupon% 1"], row["Coupon% Ref"], row["Coupon% k1"], row["k1 years"], row["Coupon% k2"],
+                    row["Coupon payment"])
+            try:
+                t0 = time.perf_counter()
+                old = legacy_cashflow(df4, df5, code, *args, row["Price Yield"])
+                t_old.append(time.perf_counter() - t0)
+            except Exception as e:
+                old = e
+            try:
+                t0 = time.perf_counter()
+                new = bond.cashflow(trd, row["Price Yield"])
+                t_new.append(time.perf_counter() - t0)
+            except Exception as e:
+                new = e
+
+            if isinstance(old, Exception) or isinstance(new, Exception):
+                if isinstance(old, Exception) != isinstance(new, Exception):
+                    mismatches.append((code, trd, f"only one side failed: old={old!r} new={new!r}"))
+                continue
+            n += 1
+
+            cfT, ptd, sumcf, sumdc, d_nxt, tci, prv_xdt = old
+            rows, ptd2, sumcf2, sumdc2, d_nxt2, tci2, prv_xdt2 = new
+            problems = []
+            if _legacy_records(cfT) != cashflow_records(rows):
+                problems.append("cash flow table")
+            if not _same(ptd, ptd2):
+                problems.append(f"ptd {ptd} != {ptd2}")
+            if sumcf != sumcf2 or not _same(sumdc, sumdc2) or not _same(tci, tci2):
+                problems.append("sums")
+            if d_nxt != d_nxt2:
+                problems.append(f"d_nxt {d_nxt} != {d_nxt2}")
+            if not (prv_xdt == prv_xdt2 or (pd.isna(prv_xdt) and pd.isna(prv_xdt2))):
+                problems.append(f"prv_xdt {prv_xdt} != {prv_xdt2}")
+
+            ttt, ttt_i, frq, k = legacy_cashflow_for_reverse(code, df4, df5, *args)
+            ttt_i = ttt_i.rename(columns={"Coupon_int": "Coupon", "CF_int": "CF"})
+            if not _same(k, bond.accrual_factor(trd)):
+                problems.append("k")
+            for after_tax, cfs, guess in ((False, ttt, 0.07), (True, ttt_i, 0.035)):
+                try:
+                    y_old = legacy_reverso(cfs.copy(), ptd, frq, k, guess)
+                except RuntimeError:
+                    continue    # newton gave up, nothing to compare against
+                y_new = float(bond.solve_yield(trd, ptd, after_tax=after_tax, guess=guess)[0])
+                if abs(y_old - y_new) > 1e-7:
+                    problems.append(f"yield(after_tax={after_tax}) {y_old} != {y_new}")
+            if problems:
+                mismatches.append((code, trd, "; ".join(problems)))
+            elif verbose:
+                print(f"ok  {code} {trd}")
+    return n, mismatches, (t_old, t_new)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bond kernel vs original pandas cashflow() parity check")
+    parser.add_argument("snapshot", help=".sqlite file or .parquet directory (see data_sources.py export)")
+    parser.add_argument("--start", default=None, help="first trade date, yyyy-mm-dd (default today)")
+    parser.add_argument("--days", type=int, default=30, help="days between trade dates")
+    parser.add_argument("--count", type=int, default=12, help="number of trade dates")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    start = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else date.today()
+    trade_dates = [start + timedelta(days=args.days * i) for i in range(args.count)]
+    df1, df4, df5 = SnapshotSource(args.snapshot).load()
+
+    n, mismatches, (t_old, t_new) = check(df1, df4, df5, trade_dates, verbose=args.verbose)
+    for code, trd, msg in mismatches:
+        print(f"MISMATCH {code} {trd}: {msg}")
+    if t_new:
+        print(f"checked {n} (bond, trade date) pairs: {len(mismatches)} mismatches; "
+              f"median per price: pandas {np.median(t_old) * 1e3:.3f} ms, numpy {np.median(t_new) * 1e3:.3f} ms")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from bond import book_for
+from pricing import BUILD_ERRORS, fee_rates
+
+# Portfolio valuation, streamed: positions are read, valued and written back one
+# chunk at a time, so memory stays flat whatever the size of the holdings file.
+# Inside a chunk the positions are grouped by bond; every bond comes from the
+# BondBook of the current data, so its schedule is built once per data version.
+#
+# Positions (CSV with a header, or NDJSON), per line:
+#   code        bond code (required)
+#   par         face amount held (default: one bond, the sheet's Par value)
+#   trade_date  yyyy-mm-dd (default today)
+#   yield       in %, like the page (default: the sheet's Price Yield)
+# One NDJSON result per position, in input order, then a {"summary": ...} line.
+#
+#   POST /portfolio  (body or multipart "file"; ?format=csv|ndjson)
+#   python portfolio.py positions.csv > results.ndjson
+
+CHUNK_SIZE = int(os.environ.get("PORTFOLIO_CHUNK", "1000"))
+
+
+def read_positions(lines, fmt):
+    """(line number, position dict) for every non-empty line of a CSV or NDJSON stream of text lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            if any(v for v in row.values() if v):
+                yield reader.line_num, {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+    else:
+        for n, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = {"_error": "not valid JSON"}
+            yield n, obj if isinstance(obj, dict) else {"_error": "not a JSON object"}
+
+
+def _parse(position, df1, today):
+    if "_error" in position:
+        raise ValueError(position["_error"])
+    code = str(position.get("code") or "")
+    if code not in df1.index:
+        raise ValueError(f"unknown code {code!r}")
+    trd = position.get("trade_date")
+    trd = datetime.strptime(trd, "%Y-%m-%d").date() if trd else today
+    pry = position.get("yield")
+    pry = float(pry) / 100 if pry not in (None, "") else float(df1.loc[code, "Price Yield"])
+    par = position.get("par")
+    par = float(str(par).replace(",", "")) if par not in (None, "") else None
+    return code, trd, pry, par
+
+
+def value_chunk(df1, df4, df5, chunk, today=None):
+    """Value one chunk of (line, position) pairs. Results come back in the chunk's order."""
+    today = today or date.today()
+    book = book_for(df1, df4, df5)
+    results = [None] * len(chunk)
+    groups = {}
+    for i, (line, position) in enumerate(chunk):
+        try:
+            code, trd, pry, par = _parse(position, df1, today)
+        except (ValueError, TypeError) as e:
+            results[i] = {"line": line, "code": position.get("code"), "error": str(e)}
+            continue
+        groups.setdefault(code, []).append((i, line, trd, pry, par))
+
+    for code, items in groups.items():
+        try:
+            bond = book.get(code)
+        except BUILD_ERRORS as e:
+            # a sheet row that doesn't build fails its own positions, not the stream
+            for i, line, trd, pry, par in items:
+                results[i] = {"line": line, "code": code, "error": f"cannot build bond: {e}"}
+            continue
+        mtd = bond.mtd
+        for i, line, trd, pry, par in items:
+            if trd >= mtd:
+                # abr is per day held: nothing to value on or after maturity
+                results[i] = {"line": line, "code": code, "error": f"trade date {trd} is not before maturity {mtd}"}
+                continue
+            try:
+                v = bond.price(trd, pry)
+            except ValueError as e:
+                results[i] = {"line": line, "code": code, "error": str(e)}
+                continue
+            # same abr as the page: fee by holding period, total cash in vs. investment
+            tot_investment = (1 + float(fee_rates(trd, mtd))) * v.ptd
+            abr = (v.total_cash_in - tot_investment) / tot_investment / (mtd - trd).days * 365.25
+            units = 1.0 if par is None else par / bond.par
+            results[i] = {
+                "line": line,
+                "code": code,
+                "trade_date": trd.strftime('%Y-%m-%d'),
+                "yield": round(pry * 100, 10),
+                "par": bond.par * units,
+                "ptd": int(v.ptd),
+                "abr": str(round(abr * 100, 2)),
+                "value": round(v.ptd * units, 2),
+                "d_nxt": v.d_nxt.strftime('%Y-%m-%d'),
+                "prv_xdt": None if v.start == 0 else v.prv_xdt.strftime('%Y-%m-%d'),
+            }
+    return results
+
+
+def value_positions(df1, df4, df5, positions, chunk_size=CHUNK_SIZE):
+    """Result dicts for every position, chunk by chunk, then one summary dict."""
+    today = date.today()
+    n = errors = 0
+    total = 0.0
+    it = iter(positions)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if not chunk:
+            break
+        for res in value_chunk(df1, df4, df5, chunk, today):
+            n += 1
+            if "error" in res:
+                errors += 1
+            else:
+                total += res["value"]
+            yield res
+    yield {"summary": {"positions": n, "errors": errors, "value": round(total, 2)}}
+
+
+def ndjson(results):
+    for res in results:
+        yield json.dumps(res) + "\n"
+
+
+def text_lines(stream, encoding="utf-8"):
+    """Text lines of a binary upload stream, decoded as they are read."""
+    return io.TextIOWrapper(stream, encoding=encoding, newline="")
+
+
+def guess_format(name="", content_type=""):
+    if name.lower().endswith(".csv") or "csv" in (content_type or ""):
+        return "csv"
+    return "ndjson"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Value a portfolio of positions (CSV or NDJSON) as NDJSON")
+    parser.add_argument("positions", help="positions file, '-' for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--source", default=None, help="data source (default: DATA_SOURCE or sheets)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    from data_sources import get_source
+    df1, df4, df5 = get_source(args.source).load()
+    fmt = args.format or guess_format(args.positions)
+    f = sys.stdin if args.positions == "-" else open(args.positions, newline="")
+    try:
+        for line in ndjson(value_positions(df1, df4, df5, read_positions(f, fmt), args.chunk)):
+            sys.stdout.write(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from metrics import cache_hit, cache_miss, span
+
+# Daily price grid: every code of df1 valued once for today's trade date, right
+# after each data refresh and again after midnight. home() and /update_data serve
+# the stored results and only compute live when the grid is missing or stale
+# (other data version, other day, or still being built).
+#
+# With PRICE_GRID_PATH set the grid is also pickled to disk, so a restarted
+# process with the same sheet contents doesn't have to rebuild it.
+# After a refresh that changes only some bonds the entries of the others are
+# carried over from the previous grid instead of recomputed (see dependencies.py).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.environ.get("PRICE_GRID_PATH") or None
+
+
+class PriceGrid:
+    """Precomputed route results of one data version and trade date."""
+
+    def __init__(self, build, path=DEFAULT_PATH):
+        self.build = build          # build(data, trd, reuse) -> {section: {key: result}}
+        self.path = path
+        self._grid = None           # (data version, trade date, entries)
+        self._digest = None
+        self._lock = threading.Lock()
+        self._building = None       # (version, trade date) currently being built
+        self._thread = None
+        self.enabled = True         # False: get() never serves (route benchmarks time the live path)
+
+    def get(self, data, trd, section, key):
+        """Stored result, or None (and a rebuild in the background) if the grid doesn't match."""
+        if not self.enabled:
+            return None
+        grid = self._grid
+        if grid is None or grid[0] != data.version or grid[1] != trd:
+            cache_miss("price_grid")
+            if trd == date.today():
+                same_data = grid is not None and grid[0] == data.version
+                self.rebuild_async(data, trd, self._digest if same_data else None)
+            return None
+        entry = grid[2].get(section, {}).get(key)
+        if entry is None:
+            cache_miss("price_grid")
+        else:
+            cache_hit("price_grid")
+        return entry
+
+    def rebuild(self, data, trd=None, digest=None, carry=None):
+        """Value everything for `trd` (default today) on `data` and swap the grid in.
+
+        carry=(previous version, keep(section, key)): entries of the grid of the previous
+        version that keep() accepts are handed to build() for reuse.
+        """
+        trd = trd or date.today()
+        if digest is not None and self._load(data.version, trd, digest):
+            return
+        reuse = {}
+        grid = self._grid
+        if carry is not None and grid is not None and grid[0] == carry[0] and grid[1] == trd:
+            keep = carry[1]
+            reuse = {section: {key: v for key, v in entries.items() if keep(section, key)}
+                     for section, entries in grid[2].items()}
+        t0 = time.perf_counter()
+        with span("price_grid"):
+            entries = self.build(data, trd, reuse)
+        with self._lock:
+            self._grid = (data.version, trd, entries)
+            self._digest = digest
+        logger.info("price grid for %s built in %.0f ms (version %s, %d codes, %d reused)", trd,
+                    (time.perf_counter() - t0) * 1e3, data.version, len(entries.get("codes", ())),
+                    len(reuse.get("codes", ())))
+        if digest is not None:
+            self._save(trd, digest, entries)
+
+    def rebuild_async(self, data, trd=None, digest=None, carry=None):
+        """rebuild() on a background thread, unless the same one is already running."""
+        trd = trd or date.today()
+        with self._lock:
+            if self._building == (data.version, trd):
+                return
+            self._building = (data.version, trd)
+        threading.Thread(target=self._rebuild_in_background, args=(data, trd, digest, carry), daemon=True).start()
+
+    def _rebuild_in_background(self, data, trd, digest, carry):
+        try:
+            self.rebuild(data, trd, digest, carry)
+        except Exception:
+            # routes keep computing live
+            logger.exception("price grid rebuild failed")
+        finally:
+            with self._lock:
+                self._building = None
+
+    def start(self, current):
+        """Rebuild after every midnight from `current()` (the latest RefData); started once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_daily, args=(current,), daemon=True)
+            self._thread.start()
+
+    def _run_daily(self, current):
+        while True:
+            tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+            time.sleep(max((tomorrow - datetime.now()).total_seconds(), 1))
+            try:
+                data = current()
+                grid = self._grid
+                self.rebuild(data, date.today(), self._digest if grid is not None and grid[0] == data.version else None)
+            except Exception:
+                logger.exception("daily price grid rebuild failed")
+
+    def _load(self, version, trd, digest):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception:
+            logger.exception("could not read price grid %s", self.path)
+            return False
+        if saved.get("digest") != digest or saved.get("trade_date") != trd:
+            return False
+        with self._lock:
+            self._grid = (version, trd, saved["entries"])
+            self._digest = digest
+        logger.info("price grid for %s loaded from %s", trd, self.path)
+        return True
+
+    def _save(self, trd, digest, entries):
+        if not self.path:
+            return
+        try:
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump({"digest": digest, "trade_date": trd, "entries": entries}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            logger.exception("could not write price grid %s", self.path)
@@ -0,0 +1,219 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from bond import book_for
+from calendars import calendars, settlement_dates
+from frame_cache import FrameCache
+from schedule import frequency_months
+
+# Array versions of the pricing math in bond.Bond.price().
+# price_batch() values many bonds x many trade dates in one go.
+# The arrays of the whole universe are built once per data version (arrays_for),
+# or attached from another worker's published copy (see shared_data.py).
+
+
+def fee_rates(trd, mtd):
+    """Array version of main.categorize_date_difference() (0.1% / 0.2% / 0.3% by holding period)."""
+    d1 = np.asarray(trd, dtype='datetime64[D]')
+    d2 = np.asarray(mtd, dtype='datetime64[D]')
+    d1, d2 = np.minimum(d1, d2), np.maximum(d1, d2)
+    # the loop counts whole calendar years from Jan 1st of the earlier year
+    jan1 = d1.astype('datetime64[Y]').astype('datetime64[D]')
+    same_year = d1.astype('datetime64[Y]') == d2.astype('datetime64[Y]')
+    days = np.where(same_year, d2 - d1, d2 - jan1).astype(np.int64)
+    return np.where(days < 365, 0.001, np.where(days < 730, 0.002, 0.003))
+
+
+class BondArrays:
+    """Schedules and coupons of N bonds stacked into (N, L) arrays, padded on the right."""
+    fields = ("lengths", "valid", "pay", "x_right", "coupon", "isd", "mtd", "par", "frq", "pry", "cf")
+
+    def __init__(self, df1, df4, df5, codes=None, bonds=None):
+        codes = list(df1.index if codes is None else codes)
+        if bonds is None:
+            book = book_for(df1, df4, df5)
+            bonds = [book.get(code) for code in codes]
+
+        n = len(codes)
+        width = max([len(b.pay_dates) for b in bonds] + [1])
+        self.codes = codes
+        self.lengths = np.array([len(b.pay_dates) for b in bonds], dtype=np.int64)
+        self.valid = np.arange(width)[None, :] < self.lengths[:, None]
+        # dates as int day numbers so that padding and broadcasting stay cheap
+        self.pay = np.zeros((n, width), dtype=np.int64)
+        self.x_right = np.full((n, width), np.iinfo(np.int64).min, dtype=np.int64)
+        self.coupon = np.zeros((n, width), dtype=float)
+        for j, b in enumerate(bonds):
+            m = len(b.pay_dates)
+            self.pay[j, :m] = b.pay_dates.astype(np.int64)
+            self.x_right[j, :m] = b.x_right.astype(np.int64)
+            self.coupon[j, :m] = b.coupon
+
+        rows = df1.loc[codes]
+        self.isd = np.array([np.datetime64(d, 'D') for d in rows["Issue Date"]]).astype(np.int64).reshape(n)
+        self.mtd = np.array([np.datetime64(d, 'D') for d in rows["Maturity Date"]]).astype(np.int64).reshape(n)
+        self.par = rows["Par value"].to_numpy(dtype=float)
+        self.frq = np.array([frequency_months(f) for f in rows["Coupon payment"]], dtype=float)
+        self.pry = rows["Price Yield"].to_numpy(dtype=float)
+
+        # cash flows: coupon, plus the par on the last payment
+        self.cf = self.coupon.copy()
+        has_rows = self.lengths > 0
+        self.cf[np.nonzero(has_rows)[0], self.lengths[has_rows] - 1] += self.par[has_rows]
+
+    @classmethod
+    def from_bond(cls, bond, pry):
+        """BondArrays of one Bond, with its own (possibly overridden) dates, par and frequency."""
+        m = len(bond.pay_dates)
+        pay = bond.pay_dates.astype(np.int64)[None]
+        cf = bond.cf[None] if m else np.zeros((1, 1))
+        return cls.from_fields([bond.code], {
+            "lengths": np.array([m], dtype=np.int64),
+            "valid": np.ones((1, m), dtype=bool) if m else np.zeros((1, 1), dtype=bool),
+            "pay": pay if m else np.zeros((1, 1), dtype=np.int64),
+            "x_right": bond.x_right.astype(np.int64)[None] if m else np.full((1, 1), np.iinfo(np.int64).min),
+            "coupon": bond.coupon[None] if m else np.zeros((1, 1)),
+            "isd": np.array([np.datetime64(bond.isd, 'D')]).astype(np.int64),
+            "mtd": np.array([np.datetime64(bond.mtd, 'D')]).astype(np.int64),
+            "par": np.array([bond.par], dtype=float),
+            "frq": np.array([bond.frq], dtype=float),
+            "pry": np.array([pry], dtype=float),
+            "cf": cf,
+        })
+
+    @classmethod
+    def from_fields(cls, codes, arrays):
+        """BondArrays over existing arrays (e.g. memory-mapped), nothing is copied."""
+        ba = cls.__new__(cls)
+        ba.codes = list(codes)
+        for name in cls.fields:
+            setattr(ba, name, arrays[name])
+        return ba
+
+    def take(self, codes):
+        """The rows of `codes`, as a new BondArrays."""
+        pos = {code: i for i, code in enumerate(self.codes)}
+        rows = np.array([pos[code] for code in codes], dtype=np.int64)
+        return BondArrays.from_fields(codes, {name: getattr(self, name)[rows] for name in self.fields})
+
+
+_arrays = FrameCache()
+
+
+def arrays_for(df1, df4, df5, arrays=None):
+    """BondArrays of every code of df1, built once per (df1, df4, df5) and holiday calendars.
+
+    `arrays` registers a ready-made one instead (shared_data.py attaches them from disk).
+    """
+    frames = (df1, df4, df5)
+    if arrays is not None:
+        return _arrays.put(frames, arrays, stamp=calendars.generation)
+    return _arrays.get_or_build(frames, BondArrays, stamp=calendars.generation)
+
+
+def price_arrays(ba, trade_dates, pry=None):
+    """Value every bond in `ba` on every trade date. Returns a dict of (M, N) arrays."""
+    trd = np.asarray(trade_dates, dtype='datetime64[D]').astype(np.int64).reshape(-1)
+    pry = ba.pry if pry is None else np.broadcast_to(np.asarray(pry, dtype=float), ba.pry.shape)
+    d_set = settlement_dates(trd.astype('datetime64[D]')).astype(np.int64)[:, None, None]   # (M, 1, 1)
+
+    live = ba.valid[None] & (ba.x_right[None] >= d_set)       # (M, N, L), a suffix of each schedule
+    has_cf = live.any(axis=2)
+    j0 = np.argmax(live, axis=2)                               # first coupon still to be received
+    i = np.arange(ba.pay.shape[1])[None, None, :] - j0[..., None]
+
+    base = 1 + pry * ba.frq / 12
+    dc = np.where(live, ba.cf[None] / base[None, :, None] ** np.where(live, i, 0), 0.0)
+    sumdc = dc.sum(axis=2)
+    total_cash_in = np.where(live, ba.coupon[None], 0.0).sum(axis=2) * 0.95 + ba.par[None]
+
+    rows = np.arange(ba.pay.shape[0])[None, :]
+    d_nxt = ba.pay[rows, j0]
+    d_prv = np.where(j0 == 0, ba.isd[None], ba.pay[rows, np.maximum(j0 - 1, 0)])
+    d_set2 = d_set[:, :, 0]
+    ptd = sumdc / (1 + ((d_nxt - d_set2) * pry * ba.frq) / (12 * (d_nxt - d_prv)))
+
+    past = ba.valid[None] & (ba.x_right[None] < d_set)
+    prv_xdt = np.where(past, ba.x_right[None], np.iinfo(np.int64).min).max(axis=2)
+    has_prv = past.any(axis=2)
+
+    trd2 = trd[:, None]
+    fee_trd = fee_rates(trd2.astype('datetime64[D]'), ba.mtd[None].astype('datetime64[D]'))
+    tot_investment = (1 + fee_trd) * ptd
+    with np.errstate(divide='ignore', invalid='ignore'):
+        abr = (total_cash_in - tot_investment) / tot_investment / (ba.mtd[None] - trd2) * 365.25
+
+    ptd = np.where(has_cf, ptd, np.nan)
+    abr = np.where(has_cf, abr, np.nan)
+    return {"ptd": ptd, "abr": abr, "fee": fee_trd, "d_nxt": d_nxt, "prv_xdt": prv_xdt,
+            "has_cf": has_cf, "has_prv": has_prv, "sumdc": sumdc, "total_cash_in": total_cash_in}
+
+
+# what building a Bond from a bad sheet row raises (unknown coupon case, missing column, ...)
+BUILD_ERRORS = (ValueError, KeyError, TypeError, Warning)
+
+
+def _builds(book, code):
+    try:
+        book.get(code)
+        return True
+    except BUILD_ERRORS:
+        return False
+
+
+def price_series(bond, trade_dates, pry):
+    """ptd / abr / fee of one Bond on every trade date, in one pass over its schedule.
+
+    Returns a dict of (M,) arrays; dates are int day numbers, NaN/has_cf False after the last coupon.
+    """
+    res = price_arrays(BondArrays.from_bond(bond, pry), trade_dates)
+    return {name: values[:, 0] for name, values in res.items()}
+
+
+def _day(x):
+    return date(1970, 1, 1) + timedelta(days=int(x))
+
+
+def price_batch(df1, df4, df5, codes=None, trade_dates=None):
+    """ptd / abr / next coupon / previous ex-right date for every code x trade date.
+
+    Returns a long DataFrame with one row per (code, trade_date). Bonds whose sheet row
+    can't be built get NaN / None instead of failing the whole batch.
+    """
+    import pandas as pd
+
+    if trade_dates is None:
+        trade_dates = [date.today()]
+    codes = list(df1.index if codes is None else codes)
+    try:
+        ba = arrays_for(df1, df4, df5)
+    except BUILD_ERRORS:
+        # some row of df1 doesn't build: only the requested codes that do are priced
+        book = book_for(df1, df4, df5)
+        good = [code for code in codes if _builds(book, code)]
+        ba = BondArrays(df1, df4, df5, good)
+    if codes != ba.codes:
+        priced = set(ba.codes)
+        ba = ba.take([code for code in codes if code in priced])
+    res = price_arrays(ba, trade_dates)
+    column = {code: n for n, code in enumerate(ba.codes)}
+
+    records = []
+    for m, trd in enumerate(trade_dates):
+        for code in codes:
+            n = column.get(code)
+            if n is None:
+                records.append({"code": code, "trade_date": trd, "ptd": np.nan, "abr": np.nan,
+                                "d_nxt": None, "prv_xdt": None})
+                continue
+            ok = res["has_cf"][m, n]
+            records.append({
+                "code": code,
+                "trade_date": trd,
+                "ptd": res["ptd"][m, n],
+                "abr": res["abr"][m, n],
+                "d_nxt": _day(res["d_nxt"][m, n]) if ok else None,
+                "prv_xdt": _day(res["prv_xdt"][m, n]) if res["has_prv"][m, n] else None,
+            })
+    return pd.DataFrame(records, columns=["code", "trade_date", "ptd", "abr", "d_nxt", "prv_xdt"])
@@ -0,0 +1,118 @@
+import threading
+import weakref
+
+import numpy as np
+
+from frame_cache import FrameCache
+
+# Coupon-rate projection for the floating bonds (ccase 1 and 2).
+# The average of a reference group ('BIDV, VCB', ...) over the Interest sheet (df4)
+# is computed once per df4 and kept as a year-indexed array, so projecting a
+# schedule is a plain array lookup. df4 itself is never written to.
+
+
+class RateProjector:
+    """Reference-group averages of one df4, indexed by year."""
+
+    def __init__(self, df4):
+        self._df4 = weakref.ref(df4)    # don't keep an old df4 alive after a refresh
+        years = df4['year'].to_numpy(dtype=np.int64)
+        self.first_year = int(years.min()) if len(years) else 0
+        n_years = int(years.max()) - self.first_year + 1 if len(years) else 0
+        self._rows = np.full(n_years, -1, dtype=np.int64)     # year -> row of df4, -1 if missing
+        self._rows[years - self.first_year] = np.arange(len(years))
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, ref_groups):
+        """Precompute the averages of every reference group in `ref_groups` (e.g. df1['Coupon% Ref'])."""
+        for cpR in set(ref_groups):
+            if isinstance(cpR, str) and cpR:
+                self.averages(cpR)
+        return self
+
+    def averages(self, cpR):
+        """Year-indexed average of the df4 columns listed in cpR (NaN for years not in df4)."""
+        avg = self._averages.get(cpR)
+        if avg is None:
+            r_grp = cpR.split(', ')
+            by_row = self._df4()[r_grp].mean(axis=1).to_numpy(dtype=float)
+            avg = np.where(self._rows >= 0, by_row[self._rows], np.nan)
+            avg.setflags(write=False)
+            with self._lock:
+                avg = self._averages.setdefault(cpR, avg)
+        return avg
+
+    def reference_rates(self, cpR, years):
+        """Reference-group average for each year in `years`."""
+        avg = self.averages(cpR)
+        idx = np.asarray(years, dtype=np.int64) - self.first_year
+        ok = (idx >= 0) & (idx < len(avg))
+        out = np.full(idx.shape, np.nan)
+        out[ok] = avg[idx[ok]]
+        return out
+
+    def project(self, ccase, pay_dates, frq, cp1, cpR, cpk, cpkY, cpk2):
+        """Projected annual coupon rate for each payment date (before announced rates)."""
+        n = len(pay_dates)
+        # if FIXED
+        if ccase == 0 :
+            return np.full(n, cp1, dtype=float)
+
+        years = pay_dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        rates = self.reference_rates(cpR, years)
+        # if 1st year fixed, and the rest are ref
+        if ccase == 1 :
+            rates[:int(12/frq)] = cp1 # 1st year fixed coupon!!!!
+            rates[int(12/frq):] += cpk
+        elif ccase == 2 :
+            rates[:max(int(cpkY * 12/frq), 0)] += cpk
+            rates[max(int(cpkY * 12/frq), 0):] += cpk2
+        else :
+            raise ValueError(f"Unknown coupon case {ccase!r}")
+        return rates
+
+
+_projectors = FrameCache()
+
+
+def projector_for(df4):
+    """The RateProjector of this df4 (built on first use, dropped with the DataFrame)."""
+    return _projectors.get_or_build((df4,), RateProjector)
+
+
+class AnnouncedRates:
+    """df5 indexed per bond: sorted coupon dates -> announced rate."""
+
+    def __init__(self, df5):
+        self._by_bond = {}
+        df = df5[['Bond_Code', 'Coupon_Date', 'Announced_rate']].dropna(subset=['Coupon_Date'])
+        # the old row-by-row loop let the last row win when a date was announced twice
+        df = df.drop_duplicates(['Bond_Code', 'Coupon_Date'], keep='last')
+        for code, grp in df.groupby('Bond_Code', sort=False):
+            dates = np.array(grp['Coupon_Date'].tolist(), dtype='datetime64[D]')
+            values = grp['Announced_rate'].to_numpy(dtype=float)
+            order = np.argsort(dates)
+            self._by_bond[code] = (dates[order], values[order])
+
+    def __contains__(self, code):
+        return code in self._by_bond
+
+    def apply(self, code, pay_dates, rates):
+        """Overwrite `rates` (in place) on the payment dates that have an announced rate."""
+        entry = self._by_bond.get(code)
+        if entry is None or len(pay_dates) == 0:
+            return rates
+        dates, values = entry
+        pos = np.minimum(np.searchsorted(dates, pay_dates), len(dates) - 1)
+        hit = dates[pos] == pay_dates
+        rates[hit] = values[pos[hit]]
+        return rates
+
+
+_announced = FrameCache()
+
+
+def announced_for(df5):
+    """The AnnouncedRates index of this df5 (built on first use, dropped with the DataFrame)."""
+    return _announced.get_or_build((df5,), AnnouncedRates)
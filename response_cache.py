@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import cache_hit, cache_miss
+
+# Result cache for the pricing routes (/update_data, /recalculate).
+# A result only depends on the normalized request inputs and on the sheet contents,
+# so entries are keyed by (content digest of df1/df4/df5, route inputs).
+# Bounded LRU with a TTL; a refresh that changes the sheets starts a new
+# generation and the old entries are dropped, a refresh that doesn't keeps them.
+# A refresh that changes only some bonds can carry the entries of the others
+# over to the new generation (`carry`, see dependencies.py).
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+DEFAULT_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "600"))   # seconds
+
+
+def data_digest(df1, df4, df5):
+    """Content hash of the three sheets (values, index and column names)."""
+    import pandas as pd
+
+    h = hashlib.sha1()
+    for df in (df1, df4, df5):
+        h.update(repr(list(df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of route results for one data generation at a time."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, name="response"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()    # (digest, key) -> (expires_at, value)
+        self._digests = {}               # data version -> content digest
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register(self, version, digest, keep=2, carry=None):
+        """Record the content digest of data `version`, dropping entries no recent version can use.
+
+        carry(key) -> True copies the entries of the previous version that are still valid.
+        """
+        with self._lock:
+            previous = self._digests[max(self._digests)] if self._digests else None
+            if carry is not None and previous is not None and previous != digest:
+                for (d, key), entry in list(self._entries.items()):
+                    if d == previous and carry(key):
+                        self._entries.setdefault((digest, key), entry)
+            self._digests[version] = digest
+            # the previous version stays usable, requests that started on it may still finish
+            for old in sorted(self._digests)[:-keep]:
+                del self._digests[old]
+            live = set(self._digests.values())
+            for k in [k for k in self._entries if k[0] not in live]:
+                del self._entries[k]
+
+    def get_or_compute(self, version, key, compute):
+        """Cached result of `compute()` for `key` on data `version`."""
+        full_key = (self._digests.get(version, version), key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                cache_hit(self.name)
+                return entry[1]
+            self.misses += 1
+        cache_miss(self.name)
+
+        value = compute()    # not cached if it raises
+        with self._lock:
+            self._entries[full_key] = (now + self.ttl, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries), "max_entries": self.max_entries,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from bond import Bond, book_for, return_ccase
+from calendars import calendars
+from pricing import BondArrays, price_arrays
+from rates import RateProjector, projector_for
+
+# Rate-shock scenarios over the Interest curve (df4).
+# A Shock moves every reference rate by
+#     parallel + years[year] + columns[column] + slope * (year - first year of df4)
+# (all in decimal, 0.005 = +50bp). Only the floating bonds (ccase 1/2) are rebuilt
+# under a scenario; their reference averages come from the base df4 arrays plus the
+# shift, df4 itself is never copied. Scenarios are spread over a process pool;
+# the holiday calendars go with every task, a spawned worker starts without them.
+#
+#   reprice_scenarios(df1, df4, df5, [Shock("+50bp", parallel=0.005), ...])
+#   -> codes, names, ptd (bonds x scenarios), abr (bonds x scenarios)
+
+SCENARIO_WORKERS = int(os.environ.get("SCENARIO_WORKERS", "0")) or (os.cpu_count() or 1)
+MAX_SCENARIOS = 200
+POOL_MIN_WORK = 2000    # bond x scenario valuations below which one process is faster than a pool
+
+Shock = namedtuple("Shock", ["name", "parallel", "years", "columns", "slope"], defaults=(0.0, {}, {}, 0.0))
+BASE = Shock("base")
+
+
+def shock_from_json(d, i=0):
+    """Shock from {"name", "parallel_bp", "years_bp": {year: bp}, "columns_bp": {column: bp}, "slope_bp"}."""
+    bp = 1e-4
+    return Shock(str(d.get("name") or f"scenario_{i}"),
+                 float(d.get("parallel_bp", 0)) * bp,
+                 {int(y): float(v) * bp for y, v in (d.get("years_bp") or {}).items()},
+                 {str(c): float(v) * bp for c, v in (d.get("columns_bp") or {}).items()},
+                 float(d.get("slope_bp", 0)) * bp)
+
+
+class ShockedProjector(RateProjector):
+    """A RateProjector whose reference rates are the base df4 moved by a Shock."""
+
+    def __init__(self, base, shock):
+        # same df4 and year index as the base projector, nothing is copied
+        self._df4 = base._df4
+        self.first_year = base.first_year
+        self._rows = base._rows
+        self._averages = {}
+        self._lock = threading.Lock()
+        self.shock = shock
+
+    def averages(self, cpR):
+        avg = self._averages.get(cpR)
+        if avg is None:
+            s = self.shock
+            cols = cpR.split(', ')
+            years = self.first_year + np.arange(len(self._rows))
+            year_shift = (s.parallel + s.slope * (years - self.first_year)
+                          + np.array([s.years.get(int(y), 0.0) for y in years]))
+            col_shift = np.array([s.columns.get(c, 0.0) for c in cols])
+            values = self._df4()[cols].to_numpy(dtype=float)
+            by_row = values[np.maximum(self._rows, 0)] + year_shift[:, None] + col_shift[None, :]
+            # mean over the columns that have a rate, like DataFrame.mean(axis=1)
+            present = ~np.isnan(by_row)
+            with np.errstate(invalid='ignore'):
+                mean = np.where(present, by_row, 0.0).sum(axis=1) / present.sum(axis=1)
+            avg = np.where(self._rows >= 0, mean, np.nan)
+            avg.setflags(write=False)
+            with self._lock:
+                avg = self._averages.setdefault(cpR, avg)
+        return avg
+
+
+def _scenario_bonds(df1, df4, df5, codes, shock):
+    book = book_for(df1, df4, df5)
+    if shock == BASE:
+        return [book.get(code) for code in codes]
+    projector = ShockedProjector(projector_for(df4), shock)
+    # fixed coupons don't depend on the curve, reuse the base bonds for those
+    return [Bond.from_df1(code, df1, df4, df5, projector=projector) if return_ccase(code, df1) in (1, 2)
+            else book.get(code) for code in codes]
+
+
+def price_scenarios(df1, df4, df5, codes, shocks, trd, holidays=None):
+    """(ptd, abr) arrays of shape (len(codes), len(shocks)), computed in this process.
+
+    `holidays` ({calendar: dates}, see calendars.py) replaces this process's calendars first.
+    """
+    if holidays is not None:
+        calendars.set_holidays(holidays)
+    ptd = np.full((len(codes), len(shocks)), np.nan)
+    abr = np.full((len(codes), len(shocks)), np.nan)
+    for j, shock in enumerate(shocks):
+        ba = BondArrays(df1, df4, df5, codes, bonds=_scenario_bonds(df1, df4, df5, codes, shock))
+        res = price_arrays(ba, [trd])
+        ptd[:, j] = res["ptd"][0]
+        abr[:, j] = res["abr"][0]
+    return ptd, abr
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded web server is asking for deadlocks
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def reprice_scenarios(df1, df4, df5, shocks, codes=None, trd=None, workers=None):
+    """Reprice `codes` (default: all of df1) under the base curve and every shock.
+
+    Returns (codes, scenario names, ptd, abr), ptd/abr being bonds x scenarios with the
+    base scenario first. Bonds with nothing left to pay after `trd` are NaN.
+    """
+    codes = list(df1.index if codes is None else codes)
+    trd = trd or date.today()
+    shocks = [BASE] + [s for s in shocks if s != BASE]
+    workers = min(workers or SCENARIO_WORKERS, len(shocks))
+
+    # no pool for what one process does faster than it can ship the sheets to another
+    if workers <= 1 or len(codes) * len(shocks) < POOL_MIN_WORK:
+        ptd, abr = price_scenarios(df1, df4, df5, codes, shocks, trd)
+    else:
+        chunks = [c for c in np.array_split(np.arange(len(shocks)), workers) if len(c)]
+        pool = _get_pool(SCENARIO_WORKERS)
+        holidays = calendars.holidays()
+        futures = [pool.submit(price_scenarios, df1, df4, df5, codes, [shocks[i] for i in c], trd, holidays)
+                   for c in chunks]
+        results = [f.result() for f in futures]
+        ptd = np.hstack([r[0] for r in results])
+        abr = np.hstack([r[1] for r in results])
+    return codes, [s.name for s in shocks], ptd, abr
@@ -0,0 +1,72 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from calendars import calendars, ex_right_dates
+
+# Coupon schedule engine.
+# Builds the payment dates of a bond (issue date + frq months, + 2*frq months, ...
+# with relativedelta-style month-end clamping) together with the accrual days
+# and the ex-right dates, all as NumPy arrays in one pass.
+# Ex-right dates count business days of a holiday calendar (see calendars.py);
+# the calendar generation is part of the cache key, so reloading the holidays
+# retires the old schedules.
+
+FREQUENCY_MONTHS = {"quarterly": 3, "semi-annually": 6, "annually": 12}
+
+# pay_dates / x_right are datetime64[D], days is int64 (days since the previous payment)
+Schedule = namedtuple("Schedule", ["pay_dates", "days", "x_right"])
+
+
+def frequency_months(frq):
+    """'quarterly' -> 3, 'semi-annually' -> 6, 'annually' -> 12 (ints pass through)."""
+    if isinstance(frq, (int, np.integer)):
+        return int(frq)
+    try:
+        return FREQUENCY_MONTHS[frq]
+    except KeyError:
+        raise Warning("Frequency => incorrect value")
+
+
+def add_months(isd, months):
+    """isd + relativedelta(months=m) for every m in `months`, as datetime64[D]."""
+    start = np.datetime64(isd, "D")
+    month = start.astype("datetime64[M]") + np.asarray(months)
+    month_len = ((month + 1).astype("datetime64[D]") - month.astype("datetime64[D]")).astype(np.int64)
+    day = (start - start.astype("datetime64[M]").astype("datetime64[D]")).astype(np.int64) + 1
+    return month.astype("datetime64[D]") + (np.minimum(day, month_len) - 1)
+
+
+def payment_dates(isd, mtd, frq):
+    """Coupon dates from isd + frq months up to the first date on/after mtd."""
+    isd64 = np.datetime64(isd, "D")
+    mtd64 = np.datetime64(mtd, "D")
+    span = (mtd64.astype("datetime64[M]") - isd64.astype("datetime64[M]")).astype(np.int64)
+    n_max = max(int(span // frq) + 2, 1)
+    dates = add_months(isd, frq * np.arange(1, n_max + 1))
+    # same as the old while loop: nothing if the first coupon is already past maturity,
+    # otherwise every date up to and including the first one >= mtd
+    if dates[0] >= mtd64:
+        return dates[:0]
+    n = int(np.argmax(dates >= mtd64)) + 1
+    return dates[:n]
+
+
+@lru_cache(maxsize=4096)
+def _build_schedule(isd, mtd, frq, exr, calendar, generation):
+    pay = payment_dates(isd, mtd, frq)
+    days = np.diff(pay, prepend=np.datetime64(isd, "D")).astype(np.int64)
+    xrt = ex_right_dates(pay, exr, calendar)
+    for arr in (pay, days, xrt):
+        arr.setflags(write=False)   # shared between callers through the cache
+    return Schedule(pay, days, xrt)
+
+
+def build_schedule(isd, mtd, frq, exr, calendar=None):
+    """Memoized Schedule for (issue date, maturity, frequency, ex-right days, holiday calendar)."""
+    return _build_schedule(isd, mtd, frequency_months(frq), int(exr), calendar or None, calendars.generation)
+
+
+def schedule_cache_info():
+    return _build_schedule.cache_info()
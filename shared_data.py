@@ -0,0 +1,313 @@
+import argparse
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from calendars import calendars
+from data_sources import DataSource, get_source
+from data_store import DEFAULT_TTL
+from metrics import cache_hit, cache_miss, span
+from pricing import BondArrays, arrays_for
+from sheet_schema import RowError
+
+# Reference data shared by all the worker processes of a machine.
+# Whichever worker first finds the published copy too old takes a file lock,
+# loads the wrapped source (the Sheets API call happens once per machine, not
+# once per worker) and publishes the parsed sheets and the bond arrays of the
+# whole universe as .npy column files. Every worker maps them read-only.
+#
+#   <dir>/frames/<digest>/   one parsed sheet, one .npy per column + frame.json
+#   <dir>/arrays/<digest>/   pricing.BondArrays of every code (np.load mmap_mode='r')
+#   <dir>/versions/<n>.json  which frames/arrays make up version n
+#   <dir>/CURRENT            name of the latest version file, swapped with os.replace
+#
+# Frames and arrays are content addressed, so a refresh that changes one sheet
+# writes one sheet, and a worker keeps the DataFrame objects of the unchanged
+# ones (the caches built on them stay warm, see dependencies.py). The bond
+# arrays are used zero-copy; the small sheets are rebuilt as DataFrames from
+# the mapped columns (text and date columns become Python objects again).
+#
+#   SHARED_DATA_DIR=/tmp/refdata DATA_SOURCE=fake gunicorn -w 4 main:app
+#   python shared_data.py workers /tmp/refdata -n 4 --source fake
+#   python shared_data.py status /tmp/refdata
+
+logger = logging.getLogger(__name__)
+
+KEEP_VERSIONS = 3
+
+
+def frame_digest(df):
+    """Content hash of one DataFrame (values, index, column names and dtypes)."""
+    import pandas as pd
+
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(repr(df.index.name).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _is_dates(values):
+    return all(v is None or (isinstance(v, datetime.date) and not isinstance(v, datetime.datetime))
+               for v in values)
+
+
+def write_frame(path, df):
+    """Save `df` column by column under the directory `path` (written elsewhere, then renamed)."""
+    import pandas as pd
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp)
+    index = df.index.name
+    frame = df.reset_index() if index is not None else df
+    columns = []
+    for i, (name, col) in enumerate(frame.items()):
+        spec = {"name": name, "file": f"{i}.npy"}
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            spec.update(kind="category", categories=col.cat.categories.tolist(), ordered=bool(col.cat.ordered))
+            np.save(os.path.join(tmp, spec["file"]), col.cat.codes.to_numpy())
+        elif col.dtype.kind in "biufM":
+            spec["kind"] = "array"
+            np.save(os.path.join(tmp, spec["file"]), col.to_numpy())
+        elif _is_dates(col.tolist()):
+            spec["kind"] = "date"
+            np.save(os.path.join(tmp, spec["file"]), np.array(col.tolist(), dtype="datetime64[D]"))
+        else:
+            # text and anything else: small, kept as JSON
+            spec.update(kind="json", values=col.tolist(), file=None)
+        columns.append(spec)
+    with open(os.path.join(tmp, "frame.json"), "w") as f:
+        json.dump({"index": index, "columns": columns}, f)
+    _rename_dir(tmp, path)
+
+
+def read_frame(path):
+    """DataFrame saved by write_frame(); numeric columns come from read-only memory maps."""
+    import pandas as pd
+
+    with open(os.path.join(path, "frame.json")) as f:
+        meta = json.load(f)
+    data = {}
+    for spec in meta["columns"]:
+        if spec["kind"] == "json":
+            data[spec["name"]] = np.array(spec["values"], dtype=object)
+            continue
+        arr = np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+        if spec["kind"] == "category":
+            data[spec["name"]] = pd.Categorical.from_codes(arr, spec["categories"], ordered=spec["ordered"])
+        elif spec["kind"] == "date":
+            data[spec["name"]] = arr.astype(object)     # datetime.date, like the parser's
+        else:
+            data[spec["name"]] = arr
+    df = pd.DataFrame(data, columns=[spec["name"] for spec in meta["columns"]])
+    return df.set_index(meta["index"]) if meta["index"] is not None else df
+
+
+def write_arrays(path, ba):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp)
+    for name in BondArrays.fields:
+        np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(getattr(ba, name)))
+    with open(os.path.join(tmp, "codes.json"), "w") as f:
+        json.dump([str(c) for c in ba.codes], f)
+    _rename_dir(tmp, path)
+
+
+def read_arrays(path):
+    """BondArrays over read-only memory maps of the files written by write_arrays()."""
+    with open(os.path.join(path, "codes.json")) as f:
+        codes = json.load(f)
+    return BondArrays.from_fields(codes, {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                                          for name in BondArrays.fields})
+
+
+def _rename_dir(tmp, path):
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # same content already published by somebody else
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class SharedSource(DataSource):
+    """Wraps another source; its data is loaded by one worker and mapped by all the others."""
+    name = "shared"
+
+    def __init__(self, source, path, max_age=DEFAULT_TTL):
+        self.source = source
+        self.path = path
+        self.max_age = max_age        # seconds before a published version counts as stale
+        self._frames = {}             # digest -> DataFrame of the attached version
+        self._record = None           # version record of the attached version
+        self._force = False
+        for sub in ("frames", "arrays", "versions"):
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+
+    def current(self):
+        """Record of the latest published version, or None."""
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                name = f.read().strip()
+            with open(os.path.join(self.path, "versions", name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self):
+        started = time.time()
+        record = self.current()
+        if self._usable(record, started):
+            cache_hit("shared_data")
+        else:
+            with self._locked():
+                record = self.current()
+                # somebody may have published while we waited for the lock
+                if self._usable(record, started) or (record is not None and record["published_at"] >= started):
+                    cache_hit("shared_data")
+                else:
+                    cache_miss("shared_data")
+                    record = self.publish(*self.source.load())
+                self._force = False
+        try:
+            return self.attach(record)
+        except FileNotFoundError:
+            # pruned between reading CURRENT and mapping it, the next one is there now
+            return self.attach(self.current())
+
+    def _usable(self, record, now):
+        return record is not None and not self._force and now - record["published_at"] < self.max_age
+
+    def expire(self):
+        """Make the next load() reload the wrapped source instead of mapping the published copy."""
+        self._force = True
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.path, "lock"), "a+") as f, span("shared_data_lock"):
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, df1, df4, df5):
+        """Write a new version from these frames and make it current. Call with the lock held."""
+        with span("shared_data_publish"):
+            digests = [frame_digest(df) for df in (df1, df4, df5)]
+            for digest, df in zip(digests, (df1, df4, df5)):
+                path = os.path.join(self.path, "frames", digest)
+                if not os.path.exists(path):
+                    write_frame(path, df)
+                # same content: this worker keeps its own frames instead of re-reading them
+                self._frames.setdefault(digest, df)
+
+            holidays = calendars.fingerprint()
+            arrays = hashlib.sha1("".join(digests + [holidays]).encode()).hexdigest()
+            path = os.path.join(self.path, "arrays", arrays)
+            try:
+                if not os.path.exists(path):
+                    write_arrays(path, arrays_for(df1, df4, df5))
+            except Exception:
+                logger.exception("bond arrays not published, every worker builds its own")
+                arrays = None
+
+            previous = self.current()
+            version = previous["version"] + 1 if previous else 1
+            record = {"version": version, "frames": digests, "arrays": arrays, "calendar": holidays,
+                      "published_at": time.time(), "pid": os.getpid(),
+                      "errors": [[e.sheet, e.row, e.column, str(e.value), e.message]
+                                 for e in self.source.parse_errors()]}
+            name = f"{version:08d}.json"
+            with open(os.path.join(self.path, "versions", name), "w") as f:
+                json.dump(record, f)
+            with open(os.path.join(self.path, "CURRENT.tmp"), "w") as f:
+                f.write(name)
+            os.replace(os.path.join(self.path, "CURRENT.tmp"), os.path.join(self.path, "CURRENT"))
+            self._prune()
+        logger.info("reference data version %s published to %s", version, self.path)
+        return record
+
+    def _prune(self):
+        versions = sorted(os.listdir(os.path.join(self.path, "versions")))
+        keep = []
+        for name in versions[-KEEP_VERSIONS:]:
+            with open(os.path.join(self.path, "versions", name)) as f:
+                keep.append(json.load(f))
+        for name in versions[:-KEEP_VERSIONS]:
+            os.remove(os.path.join(self.path, "versions", name))
+        live = {"frames": {d for r in keep for d in r["frames"]}, "arrays": {r["arrays"] for r in keep}}
+        # workers that still map removed files keep them until they let go
+        for sub, names in live.items():
+            for name in os.listdir(os.path.join(self.path, sub)):
+                if name not in names and not name.endswith(".tmp"):
+                    shutil.rmtree(os.path.join(self.path, sub, name), ignore_errors=True)
+
+    def attach(self, record):
+        """Map the frames (and bond arrays) of a published version; the unchanged frames are kept."""
+        frames = tuple(self._frames.get(d) if d in self._frames else read_frame(os.path.join(self.path, "frames", d))
+                       for d in record["frames"])
+        self._frames = dict(zip(record["frames"], frames))
+        if record["arrays"] and record["calendar"] == calendars.fingerprint():
+            arrays_for(*frames, arrays=read_arrays(os.path.join(self.path, "arrays", record["arrays"])))
+        self._record = record
+        return frames
+
+    def parse_errors(self):
+        record = self._record
+        return [RowError(*e) for e in record["errors"]] if record else []
+
+    def fetch_values(self, name):
+        return self.source.fetch_values(name)
+
+    @property
+    def version(self):
+        return self._record["version"] if self._record else None
+
+
+def _worker(path, source_name, results):
+    source = get_source(source_name, shared_dir=path)
+    df1, df4, df5 = source.load()
+    ba = arrays_for(df1, df4, df5)
+    results.put({"pid": os.getpid(), "version": source.version, "bonds": len(df1),
+                 "loaded_sheets": getattr(source.source, "loads", None),
+                 "mapped_arrays": isinstance(ba.pay, np.memmap)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference data shared between worker processes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    st = sub.add_parser("status", help="show the current published version")
+    st.add_argument("path")
+    wk = sub.add_parser("workers", help="start N processes that load the data through the shared directory")
+    wk.add_argument("path")
+    wk.add_argument("-n", type=int, default=4)
+    wk.add_argument("--source", default=None, help="data source (default: DATA_SOURCE or sheets)")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        record = SharedSource(None, args.path).current()
+        print(json.dumps(record, indent=2) if record else f"nothing published in {args.path}")
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(args.path, args.source, results)) for _ in range(args.n)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        print(json.dumps(results.get()))
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+from schedule import FREQUENCY_MONTHS
+
+# Typed parsing of the raw sheet values (lists of strings, header first).
+# Every sheet has a column schema; each column is converted in one vectorized
+# step and the rows that don't fit are dropped and reported as RowErrors
+# instead of failing the whole load.
+#
+# Column kinds:
+#   date     - anything pd.to_datetime reads, kept as datetime.date
+#   percent  - '8.5%' -> 0.085
+#   number   - float, thousands separators allowed ('1,000,000')
+#   int      - integer, thousands separators allowed
+#   category - text from a small set (`choices` if given)
+#   text     - left as is
+# `default` replaces empty cells before conversion (the old parser used '0').
+# pandas is imported on first use, it is the slowest import of a cold start.
+
+logger = logging.getLogger(__name__)
+
+Column = namedtuple("Column", ["kind", "default", "choices"], defaults=(None, None))
+
+# one bad cell -> one RowError; `row` is the row number in the sheet (header is row 1)
+RowError = namedtuple("RowError", ["sheet", "row", "column", "value", "message"])
+
+DB_SCHEMA = {
+    "Issue Date": Column("date"),
+    "Maturity Date": Column("date"),
+    "Price Yield": Column("percent", "0"),
+    "Coupon% 1": Column("percent", "0"),
+    "Coupon% k1": Column("percent", "0"),
+    "Coupon% k2": Column("percent", "0"),
+    "Bond size": Column("number", "0"),
+    "Par value": Column("int", "0"),
+    "Ex right day": Column("int", "0"),
+    "k1 years": Column("number", "0"),
+    # anything but "Fixed" is floating (return_ccase), so only an empty type is an error
+    "Coupon Type": Column("category"),
+    "Coupon payment": Column("category", None, tuple(FREQUENCY_MONTHS)),
+}
+
+FIRST_YEAR_FIXED = ("y", "n")
+
+ANNOUNCED_SCHEMA = {
+    "Coupon_Date": Column("date"),
+    "Announced_rate": Column("percent"),
+}
+
+
+def _empty(raw):
+    return raw.isna() | (raw.astype(str).str.strip() == "")
+
+
+def _numbers(raw, percent=False):
+    import pandas as pd
+
+    s = raw.astype(str).str.strip().str.replace(",", "", regex=False)
+    if percent:
+        s = s.str.strip("%")
+    num = pd.to_numeric(s, errors="coerce")
+    return num / 100 if percent else num
+
+
+def convert_column(raw, col):
+    """(converted Series, boolean mask of the cells that failed) for one column."""
+    if col.default is not None:
+        raw = raw.where(~_empty(raw), col.default)
+    if col.kind == "date":
+        import pandas as pd
+
+        out = pd.to_datetime(raw, errors="coerce")
+        return out.dt.date, out.isna().to_numpy()
+    if col.kind in ("percent", "number"):
+        out = _numbers(raw, percent=col.kind == "percent").astype(float)
+        return out, out.isna().to_numpy()
+    if col.kind == "int":
+        num = _numbers(raw)
+        bad = (num.isna() | (num != np.floor(num))).to_numpy()
+        return num.where(~bad, 0).astype(np.int64), bad
+    if col.kind == "category":
+        bad = _empty(raw).to_numpy()
+        if col.choices is not None:
+            bad |= ~raw.isin(col.choices).to_numpy()
+        return raw.astype("category"), bad
+    return raw, np.zeros(len(raw), dtype=bool)
+
+
+def apply_schema(df, schema, sheet, errors):
+    """Convert the schema columns of `df` in place; returns the mask of rows that had an error."""
+    missing = [name for name in schema if name not in df.columns]
+    if missing:
+        # nothing row by row can fix a missing column
+        raise ValueError(f"{sheet}: missing column(s) {', '.join(missing)}")
+    bad_rows = np.zeros(len(df), dtype=bool)
+    for name, col in schema.items():
+        out, bad = convert_column(df[name], col)
+        for i in np.nonzero(bad)[0]:
+            errors.append(RowError(sheet, int(i) + 2, name, df[name].iat[i], f"not a valid {col.kind}"))
+        bad_rows |= bad
+        df[name] = out
+    return bad_rows
+
+
+def _frame(values):
+    import pandas as pd
+
+    return pd.DataFrame(values[1:], columns=values[0])
+
+
+def _report(errors):
+    for e in errors:
+        logger.warning("%s row %s, %s=%r: %s, row skipped", e.sheet, e.row, e.column, e.value, e.message)
+
+
+def parse_db(data1, errors=None):
+    """DB sheet -> df1 indexed by Code. Invalid rows are left out and added to `errors`."""
+    errors = [] if errors is None else errors
+    df1 = _frame(data1)
+    start = len(errors)
+    bad = apply_schema(df1, DB_SCHEMA, "DB", errors)
+    dup = df1["Code"].duplicated().to_numpy()
+    for i in np.nonzero(dup)[0]:
+        errors.append(RowError("DB", int(i) + 2, "Code", df1["Code"].iat[i], "duplicate code"))
+    # the coupon case of a floating bond (return_ccase) comes from "1st yr fixed"
+    no_case = ((df1["Coupon Type"] != "Fixed") & ~df1["1st yr fixed"].isin(FIRST_YEAR_FIXED)).to_numpy() & ~bad
+    for i in np.nonzero(no_case)[0]:
+        errors.append(RowError("DB", int(i) + 2, "1st yr fixed", df1["1st yr fixed"].iat[i],
+                               "must be y or n for a floating bond"))
+    df1 = df1[~(bad | dup | no_case)]
+    df1 = df1.set_index("Code")
+    _report(errors[start:])
+    return df1
+
+
+def parse_interest(data4, errors=None):
+    """Interest sheet -> df4 (int `year`, one float column per reference rate)."""
+    errors = [] if errors is None else errors
+    start = len(errors)
+    df4 = _frame(data4)
+    df4 = df4.replace("", np.nan)
+    df4 = df4.ffill(axis=0) # inccase the future interest predictions are not filled, it takes the "Today" values as the interest rate
+
+    year = _numbers(df4["year"].astype(str).str[1:])
+    bad = year.isna().to_numpy()
+    for i in np.nonzero(bad)[0]:
+        errors.append(RowError("Interest", int(i) + 2, "year", df4["year"].iat[i], "not a valid year (Y2025)"))
+    df4["year"] = year.fillna(0).astype(int)
+    for name in df4.columns.drop("year"):
+        rate = _numbers(df4[name], percent=True)
+        failed = (rate.isna() & df4[name].notna()).to_numpy()
+        for i in np.nonzero(failed)[0]:
+            errors.append(RowError("Interest", int(i) + 2, name, df4[name].iat[i], "not a valid percent"))
+        bad |= failed
+        df4[name] = rate
+    df4 = df4[~bad].reset_index(drop=True)
+    _report(errors[start:])
+    return df4
+
+
+def parse_announced(data5, errors=None):
+    """Announced_interest sheet -> df5 (Bond_Code, Coupon_Date as date, Announced_rate as float)."""
+    errors = [] if errors is None else errors
+    start = len(errors)
+    df5 = _frame(data5)
+    bad = apply_schema(df5, ANNOUNCED_SCHEMA, "Announced_interest", errors)
+    df5 = df5[~bad].reset_index(drop=True)
+    _report(errors[start:])
+    return df5
@@ -0,0 +1,99 @@
+import numpy as np
+
+from metrics import SOLVER_FALLBACKS, SOLVER_ITERATIONS
+
+# Yield-from-price solver for /reverso.
+# Same price formula as the old calculate_trading_price():
+#     P(y) = sum_i CF_i / (1 + y*frq/12)**i / (1 + k*y)
+# solved with Newton using its exact derivative, on many prices / bonds at once.
+# Anything Newton can't finish falls back to Brent's method on a bracket.
+
+MAX_ITER = 50
+TOL = 1e-12
+
+
+def _broadcast(pry, cf, frq, k, n=1):
+    cf = np.atleast_2d(np.asarray(cf, dtype=float))
+    n = max(n, cf.shape[0], np.size(pry), np.size(frq), np.size(k))
+    cf = np.broadcast_to(cf, (n, cf.shape[1]))
+    pry = np.broadcast_to(np.asarray(pry, dtype=float), (n,)).copy()
+    f = np.broadcast_to(np.asarray(frq, dtype=float) / 12, (n,))
+    k = np.broadcast_to(np.asarray(k, dtype=float), (n,))
+    return pry, cf, f, k
+
+
+def _price_and_slope(pry, cf, f, k):
+    i = np.arange(cf.shape[1])
+    base = 1 + pry * f                                       # (N,)
+    disc = base[:, None] ** -i[None, :]                      # (1 + y f)^-i
+    a = (cf * disc).sum(axis=1)                              # sum CF_i (1 + y f)^-i
+    da = -(cf * i * disc).sum(axis=1) * f / base             # d/dy of the above
+    b = 1 + k * pry
+    return a / b, (da * b - a * k) / (b * b)
+
+
+def price_derivatives(pry, cf, frq, k):
+    """(P, dP/dy, d2P/dy2) for yield(s) `pry`, from one discount-factor matrix.
+    cf is (L,) or (N, L) (pad with zeros); each result is (N,)."""
+    pry, cf, f, k = _broadcast(pry, cf, frq, k)
+    i = np.arange(cf.shape[1])
+    base = 1 + pry * f
+    disc = base[:, None] ** -i[None, :]
+    a = (cf * disc).sum(axis=1)
+    da = -(cf * i * disc).sum(axis=1) * f / base
+    d2a = (cf * i * (i + 1) * disc).sum(axis=1) * (f / base) ** 2
+    # P = a * c with c = 1 / (1 + k y)
+    c = 1 / (1 + k * pry)
+    dc = -k * c * c
+    d2c = 2 * k * k * c ** 3
+    return a * c, da * c + a * dc, d2a * c + 2 * da * dc + a * d2c
+
+
+def yield_from_price(cf, price, frq, k, guess=0.07, max_iter=MAX_ITER, tol=TOL):
+    """Yield(s) that reproduce `price`. Vectorized over bonds (rows of cf) and/or prices."""
+    price = np.asarray(price, dtype=float)
+    y, cf, f, k = _broadcast(guess, cf, frq, k, n=price.size)
+    price = np.broadcast_to(price, y.shape)
+
+    todo = np.ones(y.shape, dtype=bool)
+    for _ in range(max_iter):
+        idx = np.nonzero(todo)[0]
+        if len(idx) == 0:
+            break
+        SOLVER_ITERATIONS.inc(len(idx))
+        p, dp = _price_and_slope(y[idx], cf[idx], f[idx], k[idx])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = (p - price[idx]) / dp
+        y[idx] -= step
+        done = np.abs(step) <= tol * np.maximum(1.0, np.abs(y[idx]))
+        todo[idx[done]] = False
+        # stop Newton on the ones that blew up, Brent will take them
+        bad = ~np.isfinite(y[idx]) | (1 + y[idx] * f[idx] <= 0)
+        todo[idx[bad]] = False
+        y[idx[bad]] = np.nan
+
+    failed = np.nonzero(todo | np.isnan(y))[0]
+    if len(failed):
+        SOLVER_FALLBACKS.inc(len(failed))
+    for j in failed:
+        y[j] = _brent(cf[j], price[j], f[j], k[j])
+    return y
+
+
+def _brent(cf, price, f, k):
+    """Bracketed fallback for one problem. NaN if no bracket can be found."""
+    from scipy.optimize import brentq
+
+    def g(y):
+        return _price_and_slope(np.array([y]), cf[None, :], np.array([f]), np.array([k]))[0][0] - price
+
+    lo = -1 / f + 1e-6                     # (1 + y f) and (1 + k y) have to stay positive
+    if k > 0:
+        lo = max(lo, -1 / k + 1e-6)
+    hi = 1.0
+    glo = g(lo)
+    while glo * g(hi) > 0 and hi < 1e6:
+        hi *= 4
+    if not np.isfinite(glo) or glo * g(hi) > 0:
+        return np.nan
+    return brentq(g, lo, hi, xtol=1e-14, maxiter=200)
@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+import pytest
+
+import parity
+from data_sources import get_source
+
+# parity.py's kernel vs original pandas comparison on the generated sheets
+# (DATA_SOURCE=fake), so it runs without a spreadsheet or a snapshot:
+#   python -m pytest -q test_parity.py
+
+
+@pytest.fixture(scope="module")
+def fake_data():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("DATA_SOURCE", "fake")
+        mp.setenv("FAKE_BONDS", "40")
+        mp.delenv("SHARED_DATA_DIR", raising=False)
+        return get_source().load()
+
+
+def test_kernel_matches_pandas(fake_data):
+    trade_dates = [date(2024, 1, 15) + timedelta(days=91 * i) for i in range(8)]
+    n, mismatches, _ = parity.check(*fake_data, trade_dates)
+    assert n > 0
+    assert mismatches == []